@@ -1,10 +1,11 @@
 import asyncio
-import json
-from contextlib import AsyncExitStack
+import os
 from mcp.server.fastmcp import FastMCP
-from mcp.client.session import ClientSession
-from mcp.client.sse import sse_client
+from synapse.common.deadline import downstream, resolve_deadline
+from synapse.common.tracing import instrument, traced_tool
+from synapse.protocol.payload_store import share
 from synapse.protocol.post_office import send_message
+from synapse.protocol.session_pool import extract_data, get_session_pool
 
 # Task 7: Build Contextualist Agent to Fetch Contextual Data
 
@@ -12,72 +13,165 @@ from synapse.protocol.post_office import send_message
 WORLD_DATA_URL = "http://127.0.0.1:8001/sse"
 FINANCE_URL = "http://127.0.0.1:8002/sse"
 
+# Maximum number of concurrent upstream tool calls made by one batch
+MAX_CONCURRENCY = int(os.getenv("CONTEXTUALIST_MAX_CONCURRENCY", "8"))
+
+# Articles kept per topic by batched news lookups
+NEWS_ARTICLES_PER_TOPIC = int(os.getenv("NEWS_ARTICLES_PER_TOPIC", "3"))
+
 mcp = FastMCP("Contextualist Agent", port=8000)
+instrument(mcp, "contextualist")
 
 @mcp.tool()
-async def contextualize(topic: str, city: str, task_id: str = "default_task") -> dict:
+@traced_tool
+async def contextualize(topic: str, city: str, task_id: str = "default_task", deadline: float = 0) -> dict:
     """
     Gather news, weather, and financial context for a given topic and city.
-    Connects to the World Data Server and Finance Monitor Server.
+    Uses pooled sessions to the World Data Server and Finance Monitor Server.
+    deadline (wall-clock seconds) is passed down so every lookup only gets
+    what is left of the brief's budget.
+    The signal is written once to the payload store; the post office
+    message and the return value carry its reference.
     """
-    async with AsyncExitStack() as stack:
-        try:
-            # Connect to World Data Server (New & Weather)
-            world_conn = await stack.enter_async_context(sse_client(WORLD_DATA_URL))
-            world_session = await stack.enter_async_context(ClientSession(world_conn[0], world_conn[1]))
-            await world_session.initialize()
-            
-            # Connect to Finance Monitor Server (FX Rate)
-            finance_conn = await stack.enter_async_context(sse_client(FINANCE_URL))
-            finance_session = await stack.enter_async_context(ClientSession(finance_conn[0], finance_conn[1]))
-            await finance_session.initialize()
-
-            # Run tool calls concurrently using asyncio.gather()
-            # Note: world_session is used for both news and weather as they are on the same server
-            news_task = world_session.call_tool("search_news", arguments={"query": topic})
-            weather_task = world_session.call_tool("get_weather", arguments={"city": city})
-            fx_task = finance_session.call_tool("get_fx_rate", arguments={"location": city})
-
-            results = await asyncio.gather(news_task, weather_task, fx_task, return_exceptions=True)
-            
-            # Helper to extract data from CallToolResult or handle exception
-            def extract_data(result):
-                if isinstance(result, Exception):
-                    return {"error": str(result)}
-                # The .data payload is usually in result.content[0].text in a JSON string format if returned as dict from tool
-                content = result.content[0].text if result.content else "{}"
+    try:
+        pool = get_session_pool()
+        deadline = resolve_deadline(deadline)
+        # Tools get a little less time than this call, so their fallbacks arrive before it gives up
+        common = {"task_id": task_id, "deadline": downstream(deadline)}
+
+        # Run tool calls concurrently using asyncio.gather()
+        # Note: news and weather share one pooled session as they are on the same server
+        news_task = pool.call_tool(WORLD_DATA_URL, "search_news", {"query": topic, **common}, deadline=deadline)
+        weather_task = pool.call_tool(WORLD_DATA_URL, "get_weather", {"city": city, **common}, deadline=deadline)
+        fx_task = pool.call_tool(FINANCE_URL, "get_fx_rate", {"location": city, **common}, deadline=deadline)
+
+        results = await asyncio.gather(news_task, weather_task, fx_task, return_exceptions=True)
+
+        news_data = extract_data(results[0])
+        weather_data = extract_data(results[1])
+        fx_data = extract_data(results[2])
+
+        # Build a structured signal dictionary
+        signal = {
+            "topic": topic,
+            "city": city,
+            "news_context": news_data,
+            "weather_context": weather_data,
+            "financial_context": fx_data
+        }
+
+        signal_ref = share(signal)
+
+        # Send the signal to the Scout Agent via the protocol messaging system
+        message = {
+            "sender": "Contextualist",
+            "recipient": "Scout",
+            "task_id": task_id,
+            "status": "data_gathered",
+            "payload": signal_ref
+        }
+        send_message(message)
+
+        return signal_ref
+        
+    except Exception as e:
+        return {"error": f"Failed to gather context: {str(e)}"}
+
+@mcp.tool()
+@traced_tool
+async def contextualize_batch(cities: list[str], topic: str = "", topics: list[str] = None,
+                              task_id: str = "default_task", max_concurrency: int = MAX_CONCURRENCY,
+                              deadline: float = 0) -> dict:
+    """
+    Gather context for many cities at once.
+    Uses one topic for every city, or a per-city list of topics aligned with cities.
+    Shared lookups are deduplicated (one news batch for all topics, one FX batch for
+    all cities) and run concurrently under max_concurrency. Each city's signal is sent
+    to the post office as soon as it is ready, followed by one combined signal
+    listing every city's signal reference in the caller's order.
+    """
+    if topics and len(topics) != len(cities):
+        return {"error": "topics must have one entry per city."}
+    city_topics = topics or [topic] * len(cities)
+
+    try:
+        pool = get_session_pool()
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        deadline = resolve_deadline(deadline)
+
+        async def bounded_call(url, name, arguments):
+            arguments = {**arguments, "task_id": task_id, "deadline": downstream(deadline)}
+            async with semaphore:
                 try:
-                    return json.loads(content)
-                except json.JSONDecodeError:
-                    return {"data": content}
+                    return extract_data(await pool.call_tool(url, name, arguments, deadline=deadline))
+                except Exception as e:
+                    return extract_data(e)
 
-            news_data = extract_data(results[0])
-            weather_data = extract_data(results[1])
-            fx_data = extract_data(results[2])
+        # One call for all topics' news, one per distinct city, and one FX batch
+        distinct_topics = list(dict.fromkeys(city_topics))
+        news_task = asyncio.ensure_future(bounded_call(
+            WORLD_DATA_URL, "search_news_batch", {"queries": distinct_topics, "per_topic": NEWS_ARTICLES_PER_TOPIC}
+        ))
+        weather_tasks = {
+            c: asyncio.ensure_future(bounded_call(WORLD_DATA_URL, "get_weather", {"city": c}))
+            for c in dict.fromkeys(cities)
+        }
+        fx_task = asyncio.ensure_future(
+            bounded_call(FINANCE_URL, "get_fx_rates", {"locations": list(dict.fromkeys(cities))})
+        )
 
-            # Build a structured signal dictionary
-            signal = {
-                "topic": topic,
+        async def gather_city(index, city, city_topic):
+            news_batch, weather_data, fx_batch = await asyncio.gather(news_task, weather_tasks[city], fx_task)
+            if "error" in news_batch:
+                news_data = news_batch
+            else:
+                news_data = news_batch.get("results", {}).get(city_topic, {"error": "No news returned."})
+            if "error" in fx_batch:
+                fx_data = fx_batch
+            else:
+                fx_data = fx_batch.get("rates", {}).get(city, {"error": "No FX data returned."})
+            return index, {
+                "topic": city_topic,
                 "city": city,
                 "news_context": news_data,
                 "weather_context": weather_data,
                 "financial_context": fx_data
             }
 
-            # Send the signal to the Scout Agent via the protocol messaging system
-            message = {
+        # Stream each city's signal to the Scout Agent as it finishes
+        city_signals = [None] * len(cities)
+        jobs = [gather_city(i, c, t) for i, (c, t) in enumerate(zip(cities, city_topics))]
+        for finished in asyncio.as_completed(jobs):
+            index, signal = await finished
+            signal_ref = share(signal)
+            city_signals[index] = signal_ref
+            send_message({
                 "sender": "Contextualist",
                 "recipient": "Scout",
                 "task_id": task_id,
-                "status": "data_gathered",
-                "payload": signal
-            }
-            send_message(message)
+                "status": "city_gathered",
+                "payload": signal_ref
+            })
+
+        combined = {
+            "topics": distinct_topics,
+            "cities": city_signals
+        }
+        send_message({
+            "sender": "Contextualist",
+            "recipient": "Scout",
+            "task_id": task_id,
+            "status": "data_gathered",
+            "payload": combined
+        })
+
+        return combined
+
+    except Exception as e:
+        return {"error": f"Failed to gather context: {str(e)}"}
 
-            return signal
-            
-        except Exception as e:
-            return {"error": f"Failed to gather context: {str(e)}"}
+# Handlers for Contextualist jobs taken from the post office (see synapse.scripts.agent_worker)
+JOB_HANDLERS = {"contextualize": contextualize, "contextualize_batch": contextualize_batch}
 
 if __name__ == "__main__":
     mcp.run(transport="sse")
@@ -1,49 +1,59 @@
 import os
 import json
-from mcp.server.fastmcp import FastMCP
-from openai import OpenAI
+import asyncio
+import hashlib
+from mcp.server.fastmcp import Context, FastMCP
 from dotenv import load_dotenv
-from starlette.responses import PlainTextResponse
+from starlette.responses import JSONResponse, PlainTextResponse
+from synapse.common.cache import TTLCache, cache_stats
+from synapse.common.llm import estimate_tokens, get_llm_client, token_budget
+from synapse.common.tracing import instrument, span, traced_tool
+from synapse.protocol import history
+from synapse.protocol.payload_store import put, resolve
 
 # Task 9: Build Publisher Agent to Generate Articles
 
 load_dotenv()
 
 mcp = FastMCP("Publisher Agent", port=8005)
+instrument(mcp, "publisher")
+
+MODEL = "gpt-4o"
+MAX_TOKENS = 1000
+TEMPERATURE = 0.7
+
+# Default number of briefs generated at once by publish_briefs
+PUBLISH_MAX_CONCURRENCY = int(os.getenv("PUBLISHER_MAX_CONCURRENCY", "8"))
+
+# Rough upper bound on prompt size; long news descriptions are trimmed to fit
+PROMPT_TOKEN_BUDGET = int(os.getenv("PUBLISHER_PROMPT_TOKEN_BUDGET", "600"))
+
+# Generated articles keyed by a hash of the compacted payload, model and prompt
+article_cache = TTLCache("articles", ttl=float(os.getenv("CACHE_TTL_ARTICLES", "21600")), max_entries=512)
 
 @mcp.custom_route("/", methods=["GET"])
 async def index(request=None):
     return PlainTextResponse("Publisher Agent MCP Server is running! Use /sse to connect.")
 
-@mcp.tool()
-def publish_brief(payload: dict) -> dict:
-    """
-    Generate a journalistic daily brief article using OpenAI based on aggregated signals.
-    """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return {"error": "OPENAI_API_KEY is not set in environment variables."}
-
-    client = OpenAI(api_key=api_key)
+@mcp.custom_route("/cache", methods=["GET"])
+async def cache(request=None):
+    return JSONResponse(cache_stats())
 
-    topic = payload.get("topic", "N/A")
-    city = payload.get("city", "N/A")
-    context = payload.get("context", {})
-    media = payload.get("media", {})
+SYSTEM_PROMPT = "You are a professional journalist writing daily briefs."
 
-    prompt = f"""
+PROMPT_TEMPLATE = """
     Write a neutral, journalistic daily brief article based strictly on the following data:
 
     Topic: {topic}
     City: {city}
-    
+
     Contextual Data:
-    - News: {json.dumps(context.get('news_context', {}))}
-    - Weather: {json.dumps(context.get('weather_context', {}))}
-    - Financial (FX Rate): {json.dumps(context.get('financial_context', {}))}
-    
+    - News: {news}
+    - Weather: {weather}
+    - Financial (FX Rate): {fx}
+
     Media Data:
-    - Images: {json.dumps(media.get('images', []))}
+    - Images: {images}
 
     The article should include the following sections clearly:
     1. A catchy Headline.
@@ -55,28 +65,358 @@ def publish_brief(payload: dict) -> dict:
     Maintain a professional and informative tone.
     """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a professional journalist writing daily briefs."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.7
+# Article section rewritten when only this part of the signal changed
+# materially; new news touches most of the article, so it is rewritten whole
+SECTION_HEADINGS = {"weather": "Local Context", "fx": "Local Context", "media": "Media"}
+
+SECTION_MAX_TOKENS = 300
+
+SECTION_PROMPT_TEMPLATE = """
+    Below is a daily brief about {topic} in {city}, followed by updated data.
+    Rewrite only its "{title}" section so it reflects the updated data, in the
+    same tone and at about the same length. Start with the section's heading
+    line exactly as it is and return nothing but that section.
+
+    Brief:
+    {article}
+
+    Updated data:
+    - Weather: {weather}
+    - Financial (FX Rate): {fx}
+    - Images: {images}
+    """
+
+# Fields the article actually uses; everything else is dropped from the prompt
+NEWS_FIELDS = ("headline", "description", "source", "published_date", "error")
+WEATHER_FIELDS = ("temperature", "humidity", "description", "error")
+FX_FIELDS = ("base_code", "target_code", "conversion_rate", "last_update", "error")
+IMAGE_FIELDS = ("alt", "photographer")
+
+def _pick(data: dict, fields: tuple) -> dict:
+    if not isinstance(data, dict):
+        return {}
+    return {k: data[k] for k in fields if data.get(k) not in (None, "")}
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def compact_payload(payload: dict) -> dict:
+    """
+    Reduce the Scout signal to the fields the article uses.
+    Context and media given as payload-store references are resolved here.
+    Image URLs, dimensions and IDs are dropped, and the news description
+    is trimmed if the data would exceed PROMPT_TOKEN_BUDGET.
+    """
+    context = resolve(payload.get("context", {})) or {}
+    media = resolve(payload.get("media", {})) or {}
+
+    compact = {
+        "topic": payload.get("topic", "N/A"),
+        "city": payload.get("city", "N/A"),
+        "news": _pick(context.get("news_context", {}), NEWS_FIELDS),
+        "weather": _pick(context.get("weather_context", {}), WEATHER_FIELDS),
+        "fx": _pick(context.get("financial_context", {}), FX_FIELDS),
+        "images": [_pick(image, IMAGE_FIELDS) for image in media.get("images", []) or []],
+    }
+
+    # Batched news lookups carry a few more articles on the topic
+    news_context = context.get("news_context")
+    articles = news_context.get("articles") if isinstance(news_context, dict) else None
+    related = [a["headline"] for a in (articles or [])[1:] if isinstance(a, dict) and a.get("headline")]
+    if related:
+        compact["news"]["related_headlines"] = related
+
+    description = compact["news"].get("description")
+    if description:
+        overflow = estimate_tokens(json.dumps(compact)) - PROMPT_TOKEN_BUDGET
+        if overflow > 0:
+            keep = max(len(description) - overflow * 4, 80)
+            compact["news"]["description"] = description[:keep].rstrip() + "…"
+
+    return compact
+
+def build_prompt(payload: dict) -> str:
+    """
+    Build the article prompt from the aggregated Scout signal.
+    """
+    compact = compact_payload(payload)
+    return PROMPT_TEMPLATE.format(
+        topic=compact["topic"],
+        city=compact["city"],
+        news=_dumps(compact["news"]),
+        weather=_dumps(compact["weather"]),
+        fx=_dumps(compact["fx"]),
+        images=_dumps(compact["images"]),
+    )
+
+def cache_key(payload: dict) -> str:
+    """
+    Content address of an article: a hash of the compacted payload, the
+    model settings and the prompt template, so any change to them misses.
+    """
+    canonical = json.dumps({
+        "payload": compact_payload(payload),
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+        "system": SYSTEM_PROMPT,
+        "template": PROMPT_TEMPLATE,
+    }, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _article_result(payload: dict, article_text: str, cached: bool, refresh: str = None) -> dict:
+    # The input signal is returned by reference rather than echoed back
+    result = {
+        "topic": payload.get("topic", "N/A"),
+        "city": payload.get("city", "N/A"),
+        "article": article_text,
+        "cached": cached,
+        "payload_ref": put(payload)
+    }
+    if refresh:
+        result["refresh"] = refresh
+    return result
+
+def _is_heading(line: str) -> bool:
+    line = line.strip()
+    return line.startswith("#") or (len(line) > 4 and line.startswith("**") and line.rstrip(":").endswith("**"))
+
+def _heading_text(line: str) -> str:
+    # "## 4. Local Context:" -> "local context"
+    return line.strip().lstrip("#*0123456789. ").rstrip(":* ").lower()
+
+def _find_section(lines: list, title: str):
+    """
+    (start, end) line range of the section whose heading starts with title,
+    or None. The first heading is the headline, which may well mention a
+    section title too ("Social Media Giants Face Fines"), so it is skipped.
+    """
+    headings = [i for i, line in enumerate(lines) if _is_heading(line)]
+    for start in headings[1:]:
+        if _heading_text(lines[start]).startswith(title.lower()):
+            end = start + 1
+            while end < len(lines) and not _is_heading(lines[end]):
+                end += 1
+            return start, end
+    return None
+
+async def _rewrite_section(article: str, title: str, payload: dict):
+    """
+    The article with one section rewritten from the payload's data, or None
+    if the section can't be found.
+    """
+    lines = article.splitlines()
+    section = _find_section(lines, title)
+    if section is None:
+        return None
+
+    compact = compact_payload(payload)
+    prompt = SECTION_PROMPT_TEMPLATE.format(
+        topic=compact["topic"],
+        city=compact["city"],
+        title=title,
+        article=article,
+        weather=_dumps(compact["weather"]),
+        fx=_dumps(compact["fx"]),
+        images=_dumps(compact["images"]),
+    )
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+    await token_budget.acquire(sum(estimate_tokens(m["content"]) for m in messages) + SECTION_MAX_TOKENS)
+    async with span("openai", kind="upstream", model=MODEL, section=title):
+        response = await get_llm_client().chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            max_tokens=SECTION_MAX_TOKENS,
+            temperature=TEMPERATURE
         )
+    rewritten = (response.choices[0].message.content or "").strip()
+    if not rewritten:
+        return None
 
-        article_text = response.choices[0].message.content
+    start, end = section
+    trailing = [""] if end < len(lines) else []
+    return "\n".join(lines[:start] + rewritten.splitlines() + trailing + lines[end:])
 
-        return {
-            "topic": topic,
-            "city": city,
-            "article": article_text,
-            "original_payload": payload
-        }
+def _remember_article(payload: dict, article_text: str):
+    """
+    Keeps the article with the signal baseline it reflects, for the next
+    incremental refresh of the same topic and city.
+    """
+    changes = payload.get("changes")
+    if changes and article_text:
+        history.save("article", payload.get("topic", ""), payload.get("city", ""),
+                     {"signal": changes["signal"], "article": article_text})
+
+async def _incremental_article(payload: dict):
+    """
+    Reuses or partly rewrites the previous article for the payload's topic
+    and city, using the changes Scout found since that article's signal.
+    Returns (article_text, "reused" or "patched"), or None when the article
+    has to be generated in full.
+    """
+    changes = payload.get("changes")
+    if not changes or changes.get("baseline") is None:
+        return None
+    previous = history.load("article", payload.get("topic", ""), payload.get("city", ""))
+    if not previous or previous.get("signal") != changes["baseline"]:
+        return None
+
+    changed = changes.get("changed", [])
+    if not changed:
+        return previous["article"], "reused"
+    if any(section not in SECTION_HEADINGS for section in changed):
+        return None
+
+    article_text = previous["article"]
+    for title in sorted({SECTION_HEADINGS[section] for section in changed}):
+        article_text = await _rewrite_section(article_text, title, payload)
+        if article_text is None:
+            return None
+    _remember_article(payload, article_text)
+    return article_text, "patched"
+
+def _messages(payload: dict) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(payload)}
+    ]
+
+async def _reserve_tokens(messages: list):
+    """
+    Wait for room in the shared tokens-per-minute budget for one generation.
+    """
+    prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    await token_budget.acquire(prompt_tokens + MAX_TOKENS)
+
+async def _generate_article(payload: dict) -> str:
+    messages = _messages(payload)
+    await _reserve_tokens(messages)
+    async with span("openai", kind="upstream", model=MODEL):
+        response = await get_llm_client().chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE
+        )
+    return response.choices[0].message.content
+
+@mcp.tool()
+@traced_tool
+async def publish_brief(payload: dict, task_id: str = "") -> dict:
+    """
+    Generate a journalistic daily brief article using OpenAI based on aggregated signals.
+    Identical inputs return the previously generated article without an API call.
+    When Scout found no material change since the last brief for the topic and
+    city, that article is reused; when only local data or images changed, just
+    those sections are rewritten.
+    """
+    generated = False
+
+    async def generate():
+        nonlocal generated
+        generated = True
+        return await _generate_article(payload)
+
+    try:
+        incremental = await _incremental_article(payload)
+        if incremental is not None:
+            article_text, refresh = incremental
+            return _article_result(payload, article_text, cached=refresh == "reused", refresh=refresh)
+
+        # Concurrent requests for the same content share one generation
+        article_text = await article_cache.get_or_fetch(cache_key(payload), generate, cache_if=bool)
+        _remember_article(payload, article_text)
+        return _article_result(payload, article_text, cached=not generated,
+                               refresh="full" if payload.get("changes") else None)
 
     except Exception as e:
         return {"error": f"Failed to generate article: {str(e)}"}
 
+@mcp.tool()
+@traced_tool
+async def publish_briefs(payloads: list[dict], max_concurrency: int = PUBLISH_MAX_CONCURRENCY) -> dict:
+    """
+    Generate many briefs concurrently.
+    At most max_concurrency generations run at once, and all of them share
+    the process-wide tokens-per-minute budget (LLM_TOKENS_PER_MINUTE).
+    Results are returned in the same order as payloads.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def publish_one(payload):
+        async with semaphore:
+            return await publish_brief(payload)
+
+    results = await asyncio.gather(*(publish_one(p) for p in payloads))
+    return {
+        "count": len(results),
+        "errors": sum(1 for r in results if "error" in r),
+        "results": results
+    }
+
+@mcp.tool()
+@traced_tool
+async def publish_brief_stream(payload: dict, ctx: Context, task_id: str = "") -> dict:
+    """
+    Generate the daily brief like publish_brief, forwarding article text to the
+    caller as MCP progress notifications while the model is still writing.
+    Each notification's message carries the newly generated text.
+    """
+    try:
+        incremental = await _incremental_article(payload)
+        if incremental is not None:
+            article_text, refresh = incremental
+            await ctx.report_progress(progress=1, message=article_text)
+            return _article_result(payload, article_text, cached=refresh == "reused", refresh=refresh)
+    except Exception as e:
+        return {"error": f"Failed to generate article: {str(e)}"}
+
+    # Reported like publish_brief: a full article for a signal that changed
+    refresh = "full" if payload.get("changes") else None
+    key = cache_key(payload)
+    cached_article = article_cache.lookup(key)
+    if cached_article is not None:
+        await ctx.report_progress(progress=1, message=cached_article)
+        _remember_article(payload, cached_article)
+        return _article_result(payload, cached_article, cached=True, refresh=refresh)
+
+    try:
+        messages = _messages(payload)
+        await _reserve_tokens(messages)
+        async with span("openai", kind="upstream", model=MODEL, stream=True):
+            stream = await get_llm_client().chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                max_tokens=MAX_TOKENS,
+                temperature=TEMPERATURE,
+                stream=True
+            )
+
+            chunks = []
+            async for event in stream:
+                delta = event.choices[0].delta.content if event.choices else None
+                if not delta:
+                    continue
+                chunks.append(delta)
+                await ctx.report_progress(progress=len(chunks), message=delta)
+
+        article_text = "".join(chunks)
+        article_cache.set(key, article_text)
+        _remember_article(payload, article_text)
+
+        return _article_result(payload, article_text, cached=False, refresh=refresh)
+
+    except Exception as e:
+        return {"error": f"Failed to generate article: {str(e)}"}
+
+async def publish_brief_job(payload: dict, task_id: str = "") -> dict:
+    """
+    publish_brief for queue workers; queued payloads may be stored by reference.
+    """
+    return await publish_brief(resolve(payload), task_id=task_id)
+
+# Handlers for Publisher jobs taken from the post office (see synapse.scripts.agent_worker)
+JOB_HANDLERS = {"publish_brief": publish_brief_job}
+
 if __name__ == "__main__":
-    mcp.run(transport="sse")
\ No newline at end of file
+    mcp.run(transport="sse")
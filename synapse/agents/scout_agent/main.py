@@ -1,11 +1,17 @@
 import asyncio
-import json
 import time
-from contextlib import AsyncExitStack
+import uuid
 from mcp.server.fastmcp import FastMCP
-from mcp.client.session import ClientSession
-from mcp.client.sse import sse_client
-from synapse.protocol.post_office import send_message, read_messages, clear_messages
+from synapse.common.deadline import downstream, remaining, resolve_deadline
+from synapse.common.signal_diff import diff_signals, snapshot
+from synapse.common.tracing import instrument, span
+from synapse.protocol import history
+from synapse.protocol.demand import PREWARM_TASK_PREFIX, record
+from synapse.protocol.payload_store import resolve, share
+from synapse.protocol.post_office import send_message, clear_messages
+from synapse.protocol.delivery import wait_for
+from synapse.protocol.session_pool import extract_data, get_session_pool
+from synapse.protocol.work_queue import AGENT_DISPATCH, enqueue
 
 # Task 8: Build Scout Agent to Aggregate Signals
 
@@ -14,82 +20,163 @@ CONTEXTUALIST_URL = "http://127.0.0.1:8000/sse"
 MEDIA_ENGINE_URL = "http://127.0.0.1:8003/sse"
 
 mcp = FastMCP("Scout Agent", port=8004)
+instrument(mcp, "scout")
 
-async def _wait_for_response(task_id: str, timeout: int = 30) -> dict:
+async def _wait_for_response(task_id: str, deadline: float) -> dict:
     """
-    Polls the post office for a message matching the task_id.
+    Waits for the post office to deliver a message matching the task_id,
+    for whatever is left until deadline.
     """
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        messages = read_messages()
-        for msg in messages:
-            if msg.get("task_id") == task_id and msg.get("status") == "data_gathered":
-                return msg.get("payload", {})
-        await asyncio.sleep(1)
-    
-    raise TimeoutError(f"Timed out waiting for response with task_id: {task_id}")
+    async with span("post_office.wait", kind="wait", task_id=task_id):
+        message = await wait_for(task_id, status="data_gathered", timeout=remaining(deadline))
+    return message.get("payload", {})
+
+def _track_changes(topic: str, city: str, context, media) -> dict:
+    """
+    Diffs this signal against the last baseline for topic/city (see
+    synapse.common.signal_diff) and moves the baseline on for the sections
+    that changed materially. The Publisher uses the result to reuse or
+    partly rewrite its previous article.
+    """
+    baseline = history.load("signal", topic, city)
+    changes, next_baseline = diff_signals(baseline, snapshot(resolve(context) or {}, resolve(media) or {}))
+    if changes["changed"]:
+        history.save("signal", topic, city, next_baseline)
+    return changes
+
+async def _run_stages(stages: dict) -> tuple:
+    """
+    Runs a small dependency graph of async stages.
+    stages maps a name to (dependencies, fn) where fn receives a dict of its
+    dependencies' results. Independent stages start together and each stage
+    starts as soon as its own inputs are ready.
+    Returns (results, timings) keyed by stage name, timings in seconds.
+    """
+    tasks = {}
+    timings = {}
+
+    async def run(name):
+        deps, fn = stages[name]
+        inputs = {}
+        for dep in deps:
+            inputs[dep] = await tasks[dep]
+        start = time.perf_counter()
+        try:
+            return await fn(inputs)
+        finally:
+            timings[name] = round(time.perf_counter() - start, 3)
+
+    # All tasks are created before any of them runs, so dependencies resolve
+    for name in stages:
+        tasks[name] = asyncio.ensure_future(run(name))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except Exception:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    return {name: task.result() for name, task in tasks.items()}, timings
 
 @mcp.tool()
-async def scout(topic: str, city: str, task_id: str = "scout_task") -> dict:
+async def scout(topic: str, city: str, task_id: str = None, deadline: float = 0) -> dict:
     """
     Coordinate contextualization and media gathering for a topic.
+    Each run uses its own task_id so concurrent runs don't see each other's messages.
+    deadline is the wall-clock time the whole gathering must finish by
+    (BRIEF_DEADLINE_SECONDS from now if not given); it is passed down to
+    every agent and tool.
     """
-    # Clear previously stored messages to avoid stale data
-    clear_messages()
-    
-    async with AsyncExitStack() as stack:
-        try:
-            # Connect to Contextualist Agent
-            ctx_conn = await stack.enter_async_context(sse_client(CONTEXTUALIST_URL))
-            ctx_session = await stack.enter_async_context(ClientSession(ctx_conn[0], ctx_conn[1]))
-            await ctx_session.initialize()
-            
-            # Connect to Media Engine Agent
-            media_conn = await stack.enter_async_context(sse_client(MEDIA_ENGINE_URL))
-            media_session = await stack.enter_async_context(ClientSession(media_conn[0], media_conn[1]))
-            await media_session.initialize()
-
-            # 1. Trigger Contextualization
+    task_id = task_id or f"scout-{uuid.uuid4().hex}"
+    # Clear stale messages for this task only; other in-flight runs are untouched
+    clear_messages(task_id)
+    return await run_scout_job(topic, city, task_id, deadline)
+
+async def run_scout_job(topic: str, city: str, task_id: str, deadline: float = 0) -> dict:
+    """
+    Runs one Scout task. Queue workers call this directly; the dispatcher
+    has already cleared the task's mailbox, which still holds the job itself.
+    """
+    if not task_id.startswith(PREWARM_TASK_PREFIX):
+        # Request history for the cache pre-warm scheduler
+        record(topic, city)
+    async with span("scout", kind="tool", task_id=task_id):
+        return await _scout(topic, city, task_id, resolve_deadline(deadline))
+
+# Handlers for Scout jobs taken from the post office (see synapse.scripts.agent_worker)
+JOB_HANDLERS = {"scout": run_scout_job}
+
+async def _scout(topic: str, city: str, task_id: str, deadline: float) -> dict:
+    try:
+        # Pooled sessions to the Contextualist Agent and Media Engine
+        pool = get_session_pool()
+
+        async def gather_context(inputs):
+            # Trigger contextualization, then wait for its signal in the post office
             print(f"Triggering contextualization for topic: {topic} in {city}...")
-            await ctx_session.call_tool("contextualize", arguments={"topic": topic, "city": city, "task_id": task_id})
-            
-            # 2. Poll for the contextual signal from the post office
+            # The Contextualist gets a little less time than Scout waits, so its
+            # degraded signal still arrives before Scout gives up
+            arguments = {"topic": topic, "city": city, "task_id": task_id, "deadline": downstream(deadline)}
+            if AGENT_DISPATCH == "queue":
+                # Any Contextualist worker can pick it up; its signal arrives the same way
+                enqueue("Contextualist", "contextualize", arguments, task_id=task_id, sender="Scout")
+            else:
+                await pool.call_tool(CONTEXTUALIST_URL, "contextualize", arguments, deadline=deadline)
             print("Waiting for contextualization signal...")
-            contextual_data = await _wait_for_response(task_id)
-            
-            # 3. Call Media Engine for images
+            return await _wait_for_response(task_id, deadline)
+
+        async def search_media(inputs):
+            # Image search only needs the topic, so it runs alongside contextualization
             print(f"Searching for images for topic: {topic}...")
-            media_result = await media_session.call_tool("search_images", arguments={"query": topic, "count": 2})
-            
-            # Extract media data
-            media_content = media_result.content[0].text if media_result.content else "{}"
             try:
-                media_data = json.loads(media_content)
-            except json.JSONDecodeError:
-                media_data = {"data": media_content}
-
-            # Combine everything into a single final signal
-            final_signal = {
-                "topic": topic,
-                "city": city,
-                "context": contextual_data,
-                "media": media_data
-            }
-
-            # Send the aggregated signal to the Publisher agent
-            publisher_message = {
-                "sender": "Scout",
-                "recipient": "Publisher",
-                "task_id": task_id,
-                "status": "aggregation_complete",
-                "payload": final_signal
-            }
-            send_message(publisher_message)
-
-            return final_signal
-            
-        except Exception as e:
-            return {"error": f"Scout aggregation failed: {str(e)}"}
+                media_result = await pool.call_tool(
+                    MEDIA_ENGINE_URL, "search_images",
+                    {"query": topic, "count": 2, "task_id": task_id, "deadline": downstream(deadline)},
+                    deadline=deadline
+                )
+            except Exception as e:
+                # Images are optional; a brief without them beats no brief
+                return {"error": f"Image search failed: {str(e)}"}
+            return share(extract_data(media_result))
+
+        started = time.perf_counter()
+        results, timings = await _run_stages({
+            "context": ((), gather_context),
+            "media": ((), search_media),
+        })
+        timings["total"] = round(time.perf_counter() - started, 3)
+
+        contextual_data = results["context"]
+        media_data = results["media"]
+        changes = _track_changes(topic, city, contextual_data, media_data)
+
+        # Combine everything into a single final signal. Context and media
+        # stay as payload references; the Publisher resolves them itself.
+        final_signal = {
+            "task_id": task_id,
+            "topic": topic,
+            "city": city,
+            "context": contextual_data,
+            "media": media_data,
+            "changes": changes,
+            "timings": timings
+        }
+
+        # Send the aggregated signal to the Publisher agent
+        publisher_message = {
+            "sender": "Scout",
+            "recipient": "Publisher",
+            "task_id": task_id,
+            "status": "aggregation_complete",
+            "payload": final_signal
+        }
+        send_message(publisher_message)
+
+        return final_signal
+        
+    except Exception as e:
+        return {"error": f"Scout aggregation failed: {str(e)}"}
 
 if __name__ == "__main__":
     mcp.run(transport="sse")
@@ -0,0 +1,226 @@
+import asyncio
+import atexit
+import json
+import os
+import time
+from collections import OrderedDict
+
+# TTL response cache shared by the upstream data tools.
+# Entries expire after a per-cache TTL, the cache is bounded with LRU
+# eviction, and concurrent misses for the same key are coalesced into a
+# single upstream call. Set CACHE_DIR to persist entries across restarts.
+
+CACHE_DIR = os.getenv("CACHE_DIR")
+
+# Seconds an expired entry is kept as a fallback for when the upstream fails
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", "3600"))
+
+# Minimum seconds between writes of a persistent cache to disk
+PERSIST_INTERVAL = 5.0
+
+# Every cache created in this process, for stats reporting
+_registry = {}
+
+
+class TTLCache:
+    """
+    An LRU-bounded cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024, persist: bool = True,
+                 stale_ttl: float = CACHE_STALE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.persist_path = os.path.join(CACHE_DIR, f"{name}.json") if (persist and CACHE_DIR) else None
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}  # key -> Future shared by coalesced callers
+        self._dirty = False
+        self._last_persist = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.stale_served = 0
+
+        if self.persist_path:
+            self._load()
+            atexit.register(self.save)
+
+        _registry[name] = self
+
+    def get(self, key: str, min_ttl: float = 0):
+        """
+        Returns the cached value for key, or None if missing or expired.
+        With min_ttl, entries expiring within min_ttl seconds count as expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        now = time.time()
+        if expires_at - min_ttl <= now:
+            # Expired entries stay around as stale fallbacks until stale_ttl passes
+            if expires_at + self.stale_ttl <= now:
+                del self._entries[key]
+                self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get_stale(self, key: str):
+        """
+        Returns the value for key even if it has expired, as long as it is
+        within stale_ttl of expiring, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] + self.stale_ttl <= time.time():
+            return None
+        return entry[1]
+
+    def lookup(self, key: str):
+        """
+        Like get(), but counts the lookup as a hit or miss in the stats.
+        """
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value, ttl: float = None):
+        """
+        Stores value under key, evicting the least recently used entries
+        when the cache is full.
+        """
+        self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._mark_dirty()
+
+    async def get_or_fetch(self, key: str, fetch, cache_if=None, ttl: float = None, stale_ok: bool = False,
+                           refresh_within: float = 0):
+        """
+        Returns the cached value for key, calling the async fetch() on a miss.
+        Concurrent misses for the same key share one fetch() call.
+        The result is only stored when cache_if(result) is true (default: always).
+        ttl may be a callable taking the fetched value, for upstreams that
+        say when their data will next change.
+        With stale_ok, a result rejected by cache_if (an upstream error) is
+        replaced by the expired entry for key if there is one, marked with
+        "stale": True when it is a dict.
+        refresh_within refetches entries that would expire within that many
+        seconds, so pre-warming can renew them before readers miss.
+        """
+        value = self.get(key, refresh_within)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            if cache_if is None or cache_if(value):
+                self.set(key, value, ttl(value) if callable(ttl) else ttl)
+            elif stale_ok:
+                stale = self.get_stale(key)
+                if stale is not None:
+                    self.stale_served += 1
+                    value = {**stale, "stale": True} if isinstance(stale, dict) else stale
+            future.set_result(value)
+            return value
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counters for tuning TTLs.
+        """
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "name": self.name,
+            "ttl": self.ttl,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale_served": self.stale_served,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+    def _mark_dirty(self):
+        if not self.persist_path:
+            return
+        self._dirty = True
+        if time.time() - self._last_persist >= PERSIST_INTERVAL:
+            self.save()
+
+    def save(self):
+        """
+        Writes unexpired entries to disk if the cache is persistent.
+        """
+        if not self.persist_path or not self._dirty:
+            return
+        now = time.time()
+        entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items() if expires_at > now]
+        try:
+            os.makedirs(os.path.dirname(self.persist_path), exist_ok=True)
+            temp_path = self.persist_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.persist_path)
+            self._dirty = False
+            self._last_persist = now
+        except (OSError, TypeError) as e:
+            print(f"Error persisting cache {self.name}: {e}")
+
+    def _load(self):
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        now = time.time()
+        for key, expires_at, value in entries[-self.max_entries:]:
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+
+
+def cache_stats() -> dict:
+    """
+    Returns stats for every cache created in this process.
+    """
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+def is_cacheable(result) -> bool:
+    """
+    Default cache_if for tool results: don't cache error responses.
+    """
+    return isinstance(result, dict) and "error" not in result
@@ -0,0 +1,36 @@
+import os
+import time
+
+# End-to-end deadlines for a brief.
+# A deadline is an absolute wall-clock time (time.time()) so it can be passed
+# between processes as a plain tool argument. Every hop gives the next one
+# only what is left of the budget instead of starting its own timeout.
+
+# Budget for gathering a brief's data when the caller doesn't set a deadline
+BRIEF_DEADLINE_SECONDS = float(os.getenv("BRIEF_DEADLINE_SECONDS", "45"))
+
+# Seconds each hop keeps back from the deadline it hands downstream, so a
+# fallback answered at the downstream deadline still reaches it in time
+HOP_MARGIN_SECONDS = float(os.getenv("DEADLINE_HOP_MARGIN_SECONDS", "0.5"))
+
+
+def resolve_deadline(deadline: float = None, budget: float = BRIEF_DEADLINE_SECONDS) -> float:
+    """
+    Returns deadline, or budget seconds from now when no deadline was given.
+    """
+    return deadline or time.time() + budget
+
+
+def remaining(deadline: float) -> float:
+    """
+    Seconds left until deadline, never negative.
+    """
+    return max(0.0, deadline - time.time())
+
+
+def downstream(deadline: float, margin: float = HOP_MARGIN_SECONDS) -> float:
+    """
+    The deadline to pass to the next hop: margin seconds before deadline,
+    or a quarter of what is left when that is less.
+    """
+    return deadline - min(margin, remaining(deadline) / 4)
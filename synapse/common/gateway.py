@@ -0,0 +1,368 @@
+import asyncio
+import email.utils
+import os
+import time
+import weakref
+import httpx
+from synapse.common.http_client import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, get_http_client
+from synapse.common.metrics import counter, gauge
+from synapse.common.rate_limit import TokenBucket
+from synapse.common.tracing import span
+
+# Outbound gateway for the upstream data APIs.
+# Every request to a provider waits for a token from a bucket shared by all
+# tools using the same provider and API key, so bursts queue up just under
+# the quota instead of running into 429s. A request that could not get a
+# token before its deadline is rejected up front rather than queued. 429s
+# pause the whole bucket for the Retry-After period, and identical GETs
+# already in flight are merged into one upstream call.
+#
+# Each call only gets what is left of the caller's deadline as its HTTP
+# timeout, slow calls can be hedged with a second request, and a circuit
+# breaker per provider fails fast while the provider is unhealthy so the
+# tools can fall back to cached data.
+
+# Requests per second and burst size per provider. Override with
+# GATEWAY_RATE_<PROVIDER> and GATEWAY_BURST_<PROVIDER>, e.g. GATEWAY_RATE_NEWSAPI=0.5.
+# Providers not listed here are not rate limited.
+DEFAULT_LIMITS = {
+    "newsapi": (1.0, 5),
+    "openweather": (1.0, 10),
+    "pexels": (0.5, 10),
+    "exchangerate": (0.2, 2),
+}
+
+# Longest a request may wait in the gateway when the caller gives no deadline
+GATEWAY_MAX_WAIT = float(os.getenv("GATEWAY_MAX_WAIT", "10"))
+
+# Retries of a throttled (429) request while its deadline allows
+GATEWAY_MAX_RETRIES = int(os.getenv("GATEWAY_MAX_RETRIES", "2"))
+
+# Pause after a 429 with no usable Retry-After header, and the longest pause honoured
+DEFAULT_RETRY_AFTER = 1.0
+MAX_RETRY_AFTER = 300.0
+
+# Seconds after which a still-unanswered request is hedged with a second one.
+# Off unless GATEWAY_HEDGE_AFTER_<PROVIDER> is set, e.g. GATEWAY_HEDGE_AFTER_OPENWEATHER=0.8
+# (roughly the provider's p95). Hedges only go out when a rate-limit token is free.
+HEDGE_ENV_PREFIX = "GATEWAY_HEDGE_AFTER_"
+
+# Consecutive failures (5xx, 429 after retries, timeouts, connection errors)
+# that open a provider's circuit, and how long it stays open before one probe
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+gateway_requests = counter("synapse_gateway_requests_total",
+                           "Upstream requests through the gateway by outcome "
+                           "(sent, hedged, coalesced, rejected, throttled, short_circuited).")
+gateway_queued = gauge("synapse_gateway_queued", "Requests waiting for an upstream rate-limit token.")
+circuit_open = gauge("synapse_circuit_open", "1 while a provider's circuit breaker is open.")
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling a provider that cannot serve the request in time.
+    """
+
+    def __init__(self, provider: str, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class RateLimited(UpstreamUnavailable):
+    """
+    The provider's quota leaves no room for the request before its deadline.
+    """
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """
+    The provider has been failing and is not being called for now.
+    """
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """
+    The caller's deadline passed before the provider answered.
+    """
+
+
+class _Breaker:
+    """
+    Closed -> open after CIRCUIT_FAILURE_THRESHOLD consecutive failures;
+    after CIRCUIT_RESET_SECONDS one probe request is let through (half-open)
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def check(self):
+        if self.opened_at is None:
+            return
+        retry_after = self.opened_at + CIRCUIT_RESET_SECONDS - time.time()
+        if retry_after > 0 or self.probing:
+            gateway_requests.inc(provider=self.provider, outcome="short_circuited")
+            raise CircuitOpen(self.provider, f"{self.provider} is unavailable (circuit open)",
+                              retry_after=max(retry_after, 0.0))
+        self.probing = True
+
+    def record(self, ok: bool):
+        self.probing = False
+        if ok:
+            self.failures = 0
+            if self.opened_at is not None:
+                self.opened_at = None
+                circuit_open.set(0, provider=self.provider)
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self.opened_at = time.time()
+            circuit_open.set(1, provider=self.provider)
+
+
+class _Limiter:
+    """
+    Token bucket for one (provider, key) plus a pause set by Retry-After.
+    """
+
+    def __init__(self, provider: str, rate: float, burst: float):
+        self.provider = provider
+        self.bucket = TokenBucket(rate=rate, capacity=burst)
+        self.paused_until = 0.0  # wall clock
+        self.queued = 0
+
+    def expected_wait(self) -> float:
+        """
+        Seconds until a request joining the queue now would get its token.
+        """
+        pause = max(0.0, self.paused_until - time.time())
+        backlog = self.queued + 1 - self.bucket.available()
+        return pause + max(0.0, backlog / self.bucket.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    async def acquire(self, deadline: float):
+        """
+        Waits for a token, raising RateLimited when the wait would run past deadline.
+        """
+        wait = self.expected_wait()
+        if time.time() + wait > deadline:
+            gateway_requests.inc(provider=self.provider, outcome="rejected")
+            raise RateLimited(self.provider, f"{self.provider} rate limit: no capacity within the deadline",
+                              retry_after=wait)
+
+        self.queued += 1
+        gateway_queued.inc(provider=self.provider)
+        try:
+            while self.paused_until > time.time():
+                await asyncio.sleep(self.paused_until - time.time())
+            await asyncio.wait_for(self.bucket.acquire(), timeout=max(0.0, deadline - time.time()))
+        except asyncio.TimeoutError:
+            gateway_requests.inc(provider=self.provider, outcome="rejected")
+            raise RateLimited(self.provider, f"{self.provider} rate limit: deadline passed while queued")
+        finally:
+            self.queued -= 1
+            gateway_queued.dec(provider=self.provider)
+
+
+_limiters = {}  # (provider, key) -> _Limiter, or None when unlimited
+_breakers = {}  # provider -> _Breaker
+
+# In-flight requests per event loop, keyed by everything that identifies the GET
+_in_flight = weakref.WeakKeyDictionary()
+
+
+def _limits(provider: str):
+    name = provider.upper()
+    default_rate, default_burst = DEFAULT_LIMITS.get(provider, (None, None))
+    rate = os.getenv(f"GATEWAY_RATE_{name}", default_rate)
+    if rate is None:
+        return None
+    burst = os.getenv(f"GATEWAY_BURST_{name}", default_burst)
+    rate = float(rate)
+    return rate, float(burst) if burst is not None else max(1.0, rate)
+
+
+def _limiter(provider: str, key: str):
+    if (provider, key) not in _limiters:
+        limits = _limits(provider)
+        _limiters[(provider, key)] = _Limiter(provider, *limits) if limits else None
+    return _limiters[(provider, key)]
+
+
+def _breaker(provider: str) -> _Breaker:
+    if provider not in _breakers:
+        _breakers[provider] = _Breaker(provider)
+    return _breakers[provider]
+
+
+def _hedge_after(provider: str):
+    value = os.getenv(HEDGE_ENV_PREFIX + provider.upper())
+    return float(value) if value else None
+
+
+def _retry_after(response: httpx.Response) -> float:
+    """
+    Seconds to wait from a Retry-After header (delta seconds or HTTP date).
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return DEFAULT_RETRY_AFTER
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def _request_key(provider: str, url: str, kwargs: dict) -> tuple:
+    params = kwargs.get("params") or {}
+    headers = kwargs.get("headers") or {}
+    return (
+        provider,
+        url,
+        tuple(sorted((str(k), str(v)) for k, v in dict(params).items())),
+        tuple(sorted((str(k).lower(), str(v)) for k, v in dict(headers).items())),
+    )
+
+
+async def _get(provider: str, url: str, deadline: float, kwargs: dict, attempt: int, hedge: bool = False):
+    """
+    One GET, with the rest of the deadline as its timeout.
+    """
+    budget = deadline - time.time()
+    if budget <= 0:
+        raise DeadlineExceeded(provider, f"{provider} call skipped: deadline already passed")
+    timeout = httpx.Timeout(
+        min(HTTP_READ_TIMEOUT, budget),
+        connect=min(HTTP_CONNECT_TIMEOUT, budget),
+        pool=min(HTTP_CONNECT_TIMEOUT, budget),
+    )
+    async with span(provider, kind="upstream", attempt=attempt, hedge=hedge) as s:
+        response = await get_http_client().get(url, timeout=timeout, **kwargs)
+        if response.status_code >= 400:
+            s.mark_error(f"HTTP {response.status_code}")
+    gateway_requests.inc(provider=provider, outcome="hedged" if hedge else "sent")
+    return response
+
+
+async def _get_hedged(provider: str, url: str, limiter, deadline: float, kwargs: dict, attempt: int):
+    """
+    Sends the GET and, if it hasn't answered within the provider's hedge
+    delay, a second identical one; the first good response wins.
+    """
+    first = asyncio.ensure_future(_get(provider, url, deadline, kwargs, attempt))
+    hedge_after = _hedge_after(provider)
+    if hedge_after is None:
+        return await first
+
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return first.result()
+        # Hedges must not queue for quota or outlive the deadline
+        if deadline - time.time() > hedge_after and (limiter is None or limiter.bucket.try_acquire()):
+            tasks.add(asyncio.ensure_future(_get(provider, url, deadline, kwargs, attempt, hedge=True)))
+
+        failed = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    return task.result()
+                failed = failed or task
+        return failed.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _send(provider: str, url: str, key: str, deadline: float, kwargs: dict) -> httpx.Response:
+    breaker = _breaker(provider)
+    breaker.check()
+    try:
+        response = await _send_limited(provider, url, key, deadline, kwargs)
+    except httpx.HTTPError:
+        breaker.record(ok=False)
+        raise
+    except BaseException:
+        # Local rejections and cancellations say nothing about the provider's health
+        breaker.probing = False
+        raise
+    breaker.record(ok=response.status_code < 500 and response.status_code != 429)
+    return response
+
+
+async def _send_limited(provider: str, url: str, key: str, deadline: float, kwargs: dict) -> httpx.Response:
+    limiter = _limiter(provider, key)
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire(deadline)
+
+        response = await _get_hedged(provider, url, limiter, deadline, kwargs, attempt)
+        if response.status_code != 429:
+            return response
+
+        # Throttled: hold back every caller sharing this quota, then retry if there's time
+        gateway_requests.inc(provider=provider, outcome="throttled")
+        retry_after = _retry_after(response)
+        if limiter is not None:
+            limiter.pause(retry_after)
+        attempt += 1
+        if attempt > GATEWAY_MAX_RETRIES or time.time() + retry_after >= deadline:
+            return response
+        if limiter is None:
+            await asyncio.sleep(retry_after)
+
+
+async def upstream_get(provider: str, url: str, key: str = None, deadline: float = None, **kwargs) -> httpx.Response:
+    """
+    GET an upstream API through the gateway.
+    key identifies the quota (usually the API key) the request counts
+    against, and deadline is the wall-clock time (time.time()) by which the
+    caller needs an answer; it defaults to GATEWAY_MAX_WAIT from now.
+    Identical concurrent GETs share one upstream call and response.
+    Raises RateLimited when the provider's quota has no room before the
+    deadline, CircuitOpen while the provider is failing, and
+    DeadlineExceeded when the deadline passes first.
+    """
+    deadline = deadline or time.time() + GATEWAY_MAX_WAIT
+    if deadline <= time.time():
+        raise DeadlineExceeded(provider, f"{provider} call skipped: deadline already passed")
+    loop = asyncio.get_running_loop()
+    in_flight = _in_flight.setdefault(loop, {})
+    request_key = _request_key(provider, url, kwargs)
+
+    task = in_flight.get(request_key)
+    if task is None:
+        task = asyncio.ensure_future(_send(provider, url, key, deadline, kwargs))
+        in_flight[request_key] = task
+
+        def forget(done, request_key=request_key):
+            if in_flight.get(request_key) is done:
+                del in_flight[request_key]
+            # Callers that gave up at their deadline never see the outcome
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(forget)
+    else:
+        gateway_requests.inc(provider=provider, outcome="coalesced")
+
+    # Shielded so one caller giving up doesn't cancel the call for the others;
+    # a caller joining an earlier request still only waits until its own deadline
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=max(0.0, deadline - time.time()))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(provider, f"{provider} did not answer before the deadline")
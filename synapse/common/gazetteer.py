@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import unicodedata
+
+# Offline, memory-resident gazetteer of countries, capitals, major cities,
+# common aliases/demonyms and ISO currency codes.
+# Used to map free-text topics to a location without an LLM round trip and
+# to resolve a location's currency.
+
+GAZETTEER_FILE = os.path.join(os.path.dirname(__file__), "data", "gazetteer.json")
+
+# Longest alias, in words, considered when scanning text
+_MAX_NGRAM = 5
+
+# Aliases that are also ordinary English words; these only match when the
+# text uses the same capitalisation (all-uppercase acronyms are added too)
+_CASE_SENSITIVE = {"Nice", "Split", "Cork", "Turkey", "Kiwi", "Aussie", "Dominican", "Bali"}
+
+_index = None
+
+
+def _normalize(text: str) -> str:
+    """
+    Lowercases, strips accents and reduces punctuation to single spaces.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w]+", " ", text.lower())
+    return text.strip()
+
+
+def _load():
+    """
+    Builds the lookup tables on first use.
+    """
+    global _index
+    if _index is not None:
+        return _index
+
+    with open(GAZETTEER_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    names = {}  # normalized name -> (country entry, city or None)
+    currencies = {}  # normalized name -> currency code (includes regions)
+    case_sensitive = {}  # exact alias -> (country entry, city or None)
+
+    def add(name, entry, city):
+        if name.isupper() or name in _CASE_SENSITIVE:
+            case_sensitive[name] = (entry, city)
+        else:
+            names.setdefault(_normalize(name), (entry, city))
+        currencies.setdefault(_normalize(name), entry["currency"])
+
+    for entry in data["countries"]:
+        add(entry["country"], entry, None)
+        add(entry["capital"], entry, entry["capital"])
+        for alias in entry["aliases"]:
+            add(alias, entry, None)
+        for city in entry["cities"]:
+            add(city, entry, city)
+
+    for region in data.get("regions", []):
+        for name in [region["region"]] + region["aliases"]:
+            currencies.setdefault(_normalize(name), region["currency"])
+
+    pattern = None
+    if case_sensitive:
+        alternatives = sorted(case_sensitive, key=len, reverse=True)
+        pattern = re.compile(r"(?<!\w)(" + "|".join(re.escape(a) for a in alternatives) + r")(?!\w)")
+
+    _index = {
+        "names": names,
+        "currencies": currencies,
+        "case_sensitive": case_sensitive,
+        "pattern": pattern,
+    }
+    return _index
+
+
+def _matches(text: str) -> list:
+    """
+    Returns (entry, city) for every gazetteer name found in text,
+    preferring the longest match at each position.
+    """
+    index = _load()
+    found = []
+
+    words = _normalize(text).split()
+    i = 0
+    while i < len(words):
+        for size in range(min(_MAX_NGRAM, len(words) - i), 0, -1):
+            hit = index["names"].get(" ".join(words[i:i + size]))
+            if hit is not None:
+                found.append(hit)
+                i += size
+                break
+        else:
+            i += 1
+
+    if index["pattern"] is not None:
+        for match in index["pattern"].finditer(text):
+            found.append(index["case_sensitive"][match.group(1)])
+
+    return found
+
+
+def resolve_location(text: str) -> dict:
+    """
+    Finds the country a piece of text is most likely about.
+    Returns country, iso2, capital, city and currency, where city is a
+    specific city named in the text or otherwise the capital. Returns None
+    when nothing matches or two countries are equally likely.
+    """
+    scores = {}
+    entries = {}
+    cities = {}
+    for entry, city in _matches(text):
+        country = entry["country"]
+        scores[country] = scores.get(country, 0) + 1
+        entries[country] = entry
+        if city and country not in cities:
+            cities[country] = city
+
+    if not scores:
+        return None
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+        return None
+
+    country = ranked[0][0]
+    entry = entries[country]
+    return {
+        "country": entry["country"],
+        "iso2": entry["iso2"],
+        "capital": entry["capital"],
+        "city": cities.get(country, entry["capital"]),
+        "currency": entry["currency"],
+    }
+
+
+def currency_for(location: str) -> str:
+    """
+    Returns the ISO currency code for a country, city, alias or region,
+    or None if the location is unknown.
+    """
+    index = _load()
+    code = index["currencies"].get(_normalize(location))
+    if code:
+        return code
+    resolved = resolve_location(location)
+    return resolved["currency"] if resolved else None
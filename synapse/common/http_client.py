@@ -0,0 +1,52 @@
+import asyncio
+import os
+import weakref
+import httpx
+
+# Shared outbound HTTP client for the MCP servers.
+# One pooled AsyncClient per process keeps TCP/TLS connections alive between
+# tool calls and lets concurrent calls run in parallel on the server's loop.
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# One client per event loop; connections cannot be shared across loops
+_clients = weakref.WeakKeyDictionary()
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Builds a pooled AsyncClient with keep-alive, explicit connect/read
+    timeouts and HTTP/2 when the h2 package is installed.
+    """
+    timeout = httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_READ_TIMEOUT,
+        pool=HTTP_CONNECT_TIMEOUT,
+    )
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+    )
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=HTTP2_AVAILABLE)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared client for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = create_http_client()
+        _clients[loop] = client
+    return client
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import weakref
+from openai import AsyncOpenAI
+from synapse.common.rate_limit import TokenBucket
+
+# Process-wide async OpenAI client.
+# Reusing one client keeps its HTTP connections alive between generations
+# instead of building a new client (and connection pool) for every call.
+
+# Shared tokens-per-minute budget for every LLM call made by this process
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+
+# One client per event loop; its connection pool cannot be shared across loops
+_clients = weakref.WeakKeyDictionary()
+
+token_budget = TokenBucket(rate=LLM_TOKENS_PER_MINUTE / 60, capacity=LLM_TOKENS_PER_MINUTE)
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """
+    Returns the shared AsyncOpenAI client for the running event loop.
+    Raises RuntimeError when OPENAI_API_KEY is not configured.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set in environment variables.")
+
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # OPENAI_BASE_URL can point the client at a local stand-in (benchmarks)
+        client = AsyncOpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL") or None)
+        _clients[loop] = client
+    return client
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token) for budgeting.
+    """
+    return len(text) // 4
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+# Async token bucket shared by anything that needs to stay under an
+# upstream quota (requests per second, LLM tokens per minute, ...).
+
+
+class TokenBucket:
+    """
+    Refills at rate tokens per second up to capacity.
+    Waiters are served in FIFO order so large requests are not starved.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        """
+        Tokens available right now.
+        """
+        self._refill()
+        return self.tokens
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """
+        Takes amount tokens if they are available right now.
+        """
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def wait_time(self, amount: float = 1) -> float:
+        """
+        Seconds until amount tokens will be available.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    async def acquire(self, amount: float = 1):
+        """
+        Waits until amount tokens are available and takes them.
+        Requests larger than the bucket wait for a full bucket.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while not self.try_acquire(amount):
+                await asyncio.sleep(self.wait_time(amount))
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+
+# Change detection between successive briefs for the same topic and city.
+# A signal is reduced to a snapshot of the values an article reports, and two
+# snapshots are compared section by section. Small moves (below the
+# materiality thresholds) don't count as changes, so a brief re-run on a
+# schedule can reuse the previous article when nothing worth reporting moved.
+
+# A section change is material when the FX rate moved by more than this many percent
+DIFF_FX_PERCENT = float(os.getenv("DIFF_FX_PERCENT", "0.5"))
+
+# ... the temperature moved by more than this many degrees
+DIFF_TEMPERATURE_DEGREES = float(os.getenv("DIFF_TEMPERATURE_DEGREES", "3"))
+
+# ... or the humidity moved by more than this many percentage points
+DIFF_HUMIDITY_POINTS = float(os.getenv("DIFF_HUMIDITY_POINTS", "20"))
+
+SECTIONS = ("news", "weather", "fx", "media")
+
+
+def snapshot(context: dict, media: dict) -> dict:
+    """
+    The values of a Scout signal that an article reports, per section.
+    Sections whose lookup failed are None.
+    """
+    def usable(data):
+        return isinstance(data, dict) and "error" not in data
+
+    news = context.get("news_context")
+    weather = context.get("weather_context")
+    fx = context.get("financial_context")
+    return {
+        "news": {k: news.get(k) for k in ("headline", "url")} if usable(news) else None,
+        "weather": {k: weather.get(k) for k in ("temperature", "humidity", "description")} if usable(weather) else None,
+        "fx": {k: fx.get(k) for k in ("target_code", "conversion_rate")} if usable(fx) else None,
+        "media": sorted(str(image.get("url") or image.get("id")) for image in media.get("images", []) or [])
+        if usable(media) else None,
+    }
+
+
+def snapshot_id(snap: dict) -> str:
+    canonical = json.dumps(snap, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _moved(before, after, threshold: float, percent: bool = False) -> bool:
+    if not isinstance(before, (int, float)) or not isinstance(after, (int, float)):
+        return before != after
+    delta = abs(after - before)
+    if percent:
+        return delta > abs(before) * threshold / 100 if before else delta > 0
+    return delta > threshold
+
+
+def _section_change(section: str, before, after):
+    """
+    Why section changed materially, or None if it didn't.
+    """
+    if after is None:
+        # A failed lookup keeps what was reported last time
+        return None
+    if before is None:
+        return "new data"
+    if section == "news":
+        if before["headline"] != after["headline"] or before["url"] != after["url"]:
+            return "new headline"
+    elif section == "weather":
+        if _moved(before["temperature"], after["temperature"], DIFF_TEMPERATURE_DEGREES):
+            return f"temperature {before['temperature']} -> {after['temperature']}"
+        if _moved(before["humidity"], after["humidity"], DIFF_HUMIDITY_POINTS):
+            return f"humidity {before['humidity']} -> {after['humidity']}"
+        if before["description"] != after["description"]:
+            return f"conditions {before['description']} -> {after['description']}"
+    elif section == "fx":
+        if before["target_code"] != after["target_code"]:
+            return "different currency"
+        if _moved(before["conversion_rate"], after["conversion_rate"], DIFF_FX_PERCENT, percent=True):
+            return f"rate {before['conversion_rate']} -> {after['conversion_rate']}"
+    elif section == "media":
+        if before != after:
+            return "different images"
+    return None
+
+
+def diff_signals(baseline: dict, current: dict) -> tuple:
+    """
+    Compares a snapshot with the baseline the last article was built from.
+    Returns (changes, next_baseline). changes has the baseline and new
+    snapshot ids, the materially changed sections and why; next_baseline
+    takes the current values of changed sections only, so small moves
+    can't add up unnoticed over several runs.
+    """
+    if baseline is None:
+        next_baseline = current
+        changes = {"baseline": None, "changed": list(SECTIONS), "reasons": {}}
+    else:
+        reasons = {}
+        next_baseline = dict(baseline)
+        for section in SECTIONS:
+            reason = _section_change(section, baseline.get(section), current.get(section))
+            if reason:
+                reasons[section] = reason
+                next_baseline[section] = current[section]
+        changes = {"baseline": snapshot_id(baseline), "changed": list(reasons), "reasons": reasons}
+    changes["signal"] = snapshot_id(next_baseline)
+    return changes, next_baseline
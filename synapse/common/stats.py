@@ -0,0 +1,34 @@
+import math
+
+# Small helpers for latency reporting.
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Returns the q-th percentile (0-100) of values using linear interpolation.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: list) -> dict:
+    """
+    Returns count, mean and p50/p95/p99/max for a list of latencies in seconds.
+    """
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "mean": round(sum(latencies) / len(latencies), 4),
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+        "p99": round(percentile(latencies, 99), 4),
+        "max": round(max(latencies), 4),
+    }
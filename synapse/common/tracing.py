@@ -0,0 +1,156 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from starlette.responses import JSONResponse, PlainTextResponse
+from synapse.common.metrics import counter, gauge, histogram, render_prometheus
+
+# Cross-agent timing spans linked by task_id.
+#
+# Every span records its duration into a latency histogram (and errors /
+# in-flight counts) exposed on the server's /metrics route. Finished spans
+# are also kept in a small in-memory buffer (served on /traces) and, when
+# TRACE_LOG is set, appended as JSON lines to a file shared by all agents
+# and servers so one brief can be followed end to end by its task_id.
+
+TRACE_LOG = os.getenv("TRACE_LOG")
+
+# Finished spans kept in memory for /traces
+TRACE_BUFFER_SIZE = 2000
+
+current_task_id = contextvars.ContextVar("current_task_id", default=None)
+
+_service = {"name": "synapse"}
+_recent = deque(maxlen=TRACE_BUFFER_SIZE)
+_log_lock = threading.Lock()
+
+span_seconds = histogram("synapse_span_seconds", "Duration of traced operations in seconds.")
+span_errors = counter("synapse_span_errors_total", "Traced operations that raised or returned an error.")
+span_in_flight = gauge("synapse_span_in_flight", "Traced operations currently running.")
+
+
+def set_service(name: str):
+    """
+    Names the service that spans from this process are attributed to.
+    """
+    _service["name"] = name
+
+
+def _record(record: dict):
+    _recent.append(record)
+    if not TRACE_LOG:
+        return
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    try:
+        with _log_lock, open(TRACE_LOG, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"Error writing trace: {e}")
+
+
+class span:
+    """
+    Times a block of work, as a sync or async context manager.
+
+        async with span("newsapi", kind="upstream"):
+            ...
+
+    kind groups spans in the metrics (tool, client, upstream, wait, ...).
+    Call mark_error() to count a handled failure, such as an error dict.
+    """
+
+    def __init__(self, name: str, kind: str = "internal", task_id: str = None, **attributes):
+        self.name = name
+        self.kind = kind
+        self.task_id = task_id
+        self.attributes = attributes
+        self.error = None
+        self._token = None
+
+    def mark_error(self, error: str):
+        self.error = error
+
+    def __enter__(self):
+        if self.task_id:
+            self._token = current_task_id.set(self.task_id)
+        self.task_id = self.task_id or current_task_id.get()
+        self._labels = {"service": _service["name"], "kind": self.kind, "name": self.name}
+        span_in_flight.inc(**self._labels)
+        self._wall_start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        span_in_flight.dec(**self._labels)
+        span_seconds.observe(duration, **self._labels)
+        if exc is not None and self.error is None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if self.error is not None:
+            span_errors.inc(**self._labels)
+        if self._token is not None:
+            current_task_id.reset(self._token)
+
+        record = {
+            "task_id": self.task_id,
+            "service": _service["name"],
+            "kind": self.kind,
+            "name": self.name,
+            "start": round(self._wall_start, 6),
+            "duration": round(duration, 6),
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        if self.attributes:
+            record["attributes"] = self.attributes
+        _record(record)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def traced_tool(fn):
+    """
+    Wraps an async MCP tool in a "tool" span. A task_id argument, when the
+    tool has one, links the span (and everything under it) to the brief.
+    Error dicts returned by the tool are counted as errors.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with span(fn.__name__, kind="tool", task_id=kwargs.get("task_id") or None) as s:
+            result = await fn(*args, **kwargs)
+            if isinstance(result, dict) and "error" in result:
+                s.mark_error(str(result["error"]))
+            return result
+    return wrapper
+
+
+def recent_spans(task_id: str = None) -> list:
+    """
+    Returns finished spans from this process, optionally for one task.
+    """
+    return [r for r in _recent if task_id is None or r["task_id"] == task_id]
+
+
+def instrument(mcp, service: str):
+    """
+    Names the service and adds /metrics (Prometheus text) and /traces
+    (recent spans as JSON, filterable with ?task_id=) routes to a FastMCP server.
+    """
+    set_service(service)
+
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def metrics(request=None):
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @mcp.custom_route("/traces", methods=["GET"])
+    async def traces(request=None):
+        task_id = request.query_params.get("task_id") if request is not None else None
+        return JSONResponse(recent_spans(task_id))
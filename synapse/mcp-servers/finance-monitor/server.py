@@ -1,64 +1,126 @@
 import os
-import requests
+import time
+import httpx
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
-from starlette.responses import PlainTextResponse
+from starlette.responses import JSONResponse, PlainTextResponse
+from synapse.common.cache import TTLCache, cache_stats, is_cacheable
+from synapse.common.gazetteer import currency_for
+from synapse.common.gateway import UpstreamUnavailable, upstream_get
+from synapse.common.tracing import instrument, traced_tool
 
 # Task 4: Implement Finance MCP Server
 
 load_dotenv()
 
 mcp = FastMCP("Finance Monitor", port=8002)
+instrument(mcp, "finance-monitor")
+
+BASE_CURRENCY = "USD"
+
+# Upstream API host, overridable to point at a local stand-in (benchmarks)
+EXCHANGERATE_BASE_URL = os.getenv("EXCHANGERATE_BASE_URL", "https://v6.exchangerate-api.com")
+
+# The full USD rate table is held in memory and refreshed on the provider's
+# own schedule (time_next_update_unix); CACHE_TTL_FX is only a fallback
+fx_cache = TTLCache("fx", ttl=float(os.getenv("CACHE_TTL_FX", "3600")), max_entries=4)
 
 @mcp.custom_route("/", methods=["GET"])
 async def index(request=None):
     return PlainTextResponse("Finance Monitor MCP Server is running! Use /sse to connect.")
 
+@mcp.custom_route("/cache", methods=["GET"])
+async def cache(request=None):
+    return JSONResponse(cache_stats())
+
 def get_currency_code(location: str) -> str:
     """
     Helper function to obtain the target currency code from a location.
-    Maps common country names/locations to their ISO currency codes.
+    Resolves countries, capitals, major cities, aliases and regions through
+    the offline gazetteer.
+    """
+    return currency_for(location) or BASE_CURRENCY # Default to USD if location not found
+
+def _table_ttl(table: dict) -> float:
+    """
+    Keep the rate table until the provider's next scheduled update.
+    """
+    next_update = table.get("next_update_unix")
+    if next_update:
+        return max(next_update - time.time(), 60)
+    return fx_cache.ttl
+
+async def _get_rate_table(deadline: float = 0, refresh_within: float = 0) -> dict:
+    """
+    The current rate table, or the last one (marked stale) if the API fails.
     """
-    location_map = {
-        "usa": "USD",
-        "united states": "USD",
-        "uk": "GBP",
-        "united kingdom": "GBP",
-        "london": "GBP",
-        "europe": "EUR",
-        "germany": "EUR",
-        "france": "EUR",
-        "japan": "JPY",
-        "tokyo": "JPY",
-        "canada": "CAD",
-        "australia": "AUD",
-        "india": "INR",
-        "china": "CNY",
-        "nigeria": "NGN",
-        "lagos": "NGN"
+    return await fx_cache.get_or_fetch(BASE_CURRENCY, lambda: _fetch_rate_table(deadline),
+                                       cache_if=is_cacheable, ttl=_table_ttl, stale_ok=True,
+                                       refresh_within=refresh_within)
+
+def _resolve_currency(location: str, rates: dict) -> str:
+    """
+    Accepts either a location or an ISO currency code already in the table.
+    """
+    code = location.strip().upper()
+    if len(code) == 3 and code in rates:
+        return code
+    return get_currency_code(location)
+
+def _rate_entry(location: str, table: dict) -> dict:
+    currency_code = _resolve_currency(location, table["rates"])
+    rate = table["rates"].get(currency_code)
+    if rate is None:
+        return {"error": f"No exchange rate available for currency '{currency_code}'."}
+    entry = {
+        "base_code": BASE_CURRENCY,
+        "target_code": currency_code,
+        "conversion_rate": rate,
+        "last_update": table.get("last_update"),
+        "location_queried": location
     }
-    
-    # Normalize input
-    key = location.lower().strip()
-    return location_map.get(key, "USD") # Default to USD if location not found
+    if table.get("stale"):
+        entry["stale"] = True
+    return entry
 
 @mcp.tool()
-def get_fx_rate(location: str) -> dict:
+@traced_tool
+async def get_fx_rate(location: str, task_id: str = "", deadline: float = 0, refresh_within: float = 0) -> dict:
     """
     Fetch the foreign exchange rate for a given location relative to USD.
+    refresh_within refetches the rate table if it expires within that many seconds.
+    """
+    table = await _get_rate_table(deadline, refresh_within)
+    if "error" in table:
+        return table
+    return _rate_entry(location, table)
+
+@mcp.tool()
+@traced_tool
+async def get_fx_rates(locations: list[str], task_id: str = "", deadline: float = 0) -> dict:
+    """
+    Fetch exchange rates relative to USD for many locations or ISO currency codes at once.
     """
+    table = await _get_rate_table(deadline)
+    if "error" in table:
+        return table
+    return {
+        "base_code": BASE_CURRENCY,
+        "last_update": table.get("last_update"),
+        "rates": {location: _rate_entry(location, table) for location in locations}
+    }
+
+async def _fetch_rate_table(deadline: float = 0) -> dict:
     api_key = os.getenv("EXCHANGE_RATE_API_KEY")
     if not api_key:
         return {"error": "EXCHANGE_RATE_API_KEY is not set in environment variables."}
 
-    currency_code = get_currency_code(location)
-    
     # Building the ExchangeRate API URL
-    # Format: https://v6.exchangerate-api.com/v6/YOUR-API-KEY/pair/BASE/TARGET
-    url = f"https://v6.exchangerate-api.com/v6/{api_key}/pair/USD/{currency_code}"
+    # Format: https://v6.exchangerate-api.com/v6/YOUR-API-KEY/latest/BASE
+    url = f"{EXCHANGERATE_BASE_URL}/v6/{api_key}/latest/{BASE_CURRENCY}"
 
     try:
-        response = requests.get(url)
+        response = await upstream_get("exchangerate", url, key=api_key, deadline=deadline)
         
         if response.status_code != 200:
             return {
@@ -70,11 +132,9 @@ def get_fx_rate(location: str) -> dict:
         
         if data.get("result") == "success":
             return {
-                "base_code": "USD",
-                "target_code": currency_code,
-                "conversion_rate": data.get("conversion_rate"),
+                "rates": data.get("conversion_rates", {}),
                 "last_update": data.get("time_last_update_utc"),
-                "location_queried": location
+                "next_update_unix": data.get("time_next_update_unix")
             }
         else:
             return {
@@ -82,7 +142,9 @@ def get_fx_rate(location: str) -> dict:
                 "details": data.get("error-type", "Unknown error")
             }
             
-    except requests.exceptions.RequestException as e:
+    except UpstreamUnavailable as e:
+        return {"error": str(e)}
+    except httpx.HTTPError as e:
         return {"error": f"HTTP error occurred: {str(e)}"}
 
 if __name__ == "__main__":
@@ -1,26 +1,47 @@
 import os
-import requests
+import httpx
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
-from starlette.responses import PlainTextResponse
+from starlette.responses import JSONResponse, PlainTextResponse
+from synapse.common.cache import TTLCache, cache_stats, is_cacheable
+from synapse.common.gateway import UpstreamUnavailable, upstream_get
+from synapse.common.tracing import instrument, traced_tool
 
 # Task 5: Implement Media Engine MCP Server
 
 load_dotenv()
 
 mcp = FastMCP("Media Engine", port=8003)
+instrument(mcp, "media-engine")
 
-PEXELS_SEARCH_URL = "https://api.pexels.com/v1/search"
+# Upstream API host, overridable to point at a local stand-in (benchmarks)
+PEXELS_BASE_URL = os.getenv("PEXELS_BASE_URL", "https://api.pexels.com")
+PEXELS_SEARCH_URL = f"{PEXELS_BASE_URL}/v1/search"
+
+# Response cache: stock photo results for a topic rarely change
+images_cache = TTLCache("images", ttl=float(os.getenv("CACHE_TTL_IMAGES", "86400")), max_entries=1024)
 
 @mcp.custom_route("/", methods=["GET"])
 async def index(request=None):
     return PlainTextResponse("Media Engine MCP Server is running! Use /sse to connect.")
 
+@mcp.custom_route("/cache", methods=["GET"])
+async def cache(request=None):
+    return JSONResponse(cache_stats())
+
 @mcp.tool()
-def search_images(query: str, count: int = 1) -> dict:
+@traced_tool
+async def search_images(query: str, count: int = 1, task_id: str = "", deadline: float = 0,
+                        refresh_within: float = 0) -> dict:
     """
     Search for high-quality images using the Pexels API.
+    Falls back to the last cached result, marked stale, when the API fails.
     """
+    key = f"{query.strip().lower()}|{count}"
+    return await images_cache.get_or_fetch(key, lambda: _fetch_images(query, count, deadline),
+                                           cache_if=is_cacheable, stale_ok=True, refresh_within=refresh_within)
+
+async def _fetch_images(query: str, count: int, deadline: float = 0) -> dict:
     api_key = os.getenv("PEXELS_API_KEY")
     if not api_key:
         return {"error": "PEXELS_API_KEY is not set in environment variables."}
@@ -35,7 +56,7 @@ def search_images(query: str, count: int = 1) -> dict:
     }
 
     try:
-        response = requests.get(PEXELS_SEARCH_URL, headers=headers, params=params)
+        response = await upstream_get("pexels", PEXELS_SEARCH_URL, key=api_key, deadline=deadline, headers=headers, params=params)
         
         if response.status_code == 401:
             return {"error": "Unauthorized: Invalid Pexels API Key."}
@@ -64,9 +85,11 @@ def search_images(query: str, count: int = 1) -> dict:
             "images": formatted_images
         }
         
-    except requests.exceptions.HTTPError as e:
+    except UpstreamUnavailable as e:
+        return {"error": str(e)}
+    except httpx.HTTPStatusError as e:
         return {"error": f"HTTP error occurred: {str(e)}"}
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         return {"error": f"Request error occurred: {str(e)}"}
 
 if __name__ == "__main__":
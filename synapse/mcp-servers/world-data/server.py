@@ -1,8 +1,15 @@
+import asyncio
+import hashlib
 import os
-import requests
+import re
+import httpx
+from urllib.parse import urlsplit
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
-from starlette.responses import PlainTextResponse
+from starlette.responses import JSONResponse, PlainTextResponse
+from synapse.common.cache import TTLCache, cache_stats, is_cacheable
+from synapse.common.gateway import UpstreamUnavailable, upstream_get
+from synapse.common.tracing import instrument, traced_tool
 
 # Task 2: Implement World Data MCP Server
 # Task 3: Implement Weather MCP Tool and Run the Server
@@ -10,57 +17,277 @@ from starlette.responses import PlainTextResponse
 load_dotenv()
 
 mcp = FastMCP("World Data Server", port=8001)
+instrument(mcp, "world-data")
+
+# Upstream API hosts, overridable to point at local stand-ins (benchmarks)
+NEWSAPI_BASE_URL = os.getenv("NEWSAPI_BASE_URL", "https://newsapi.org")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org")
+
+# Response caches: headlines move faster than the weather
+news_cache = TTLCache("news", ttl=float(os.getenv("CACHE_TTL_NEWS", "300")), max_entries=512)
+weather_cache = TTLCache("weather", ttl=float(os.getenv("CACHE_TTL_WEATHER", "600")), max_entries=512)
+
+# search_news_batch: topics OR-ed into one query, at most this many per query
+# so each still gets a fair share of the page
+NEWS_BATCH_MAX_TOPICS = int(os.getenv("NEWS_BATCH_MAX_TOPICS", "5"))
+NEWS_BATCH_PAGE_SIZE = int(os.getenv("NEWS_BATCH_PAGE_SIZE", "100"))
+
+# NewsAPI's limit on the length of q
+NEWS_MAX_QUERY_CHARS = 500
+
+_WORD = re.compile(r"\w+")
+
+# Trailing " - Source Name" that syndicated copies add to the same headline
+_SOURCE_SUFFIX = re.compile(r"\s+[-|\u2013\u2014]\s+[^-|\u2013\u2014]+$")
 
 @mcp.custom_route("/", methods=["GET"])
 async def index(request=None):
     return PlainTextResponse("World Data MCP Server is running! Use /sse to connect.")
 
+@mcp.custom_route("/cache", methods=["GET"])
+async def cache(request=None):
+    return JSONResponse(cache_stats())
+
 
 @mcp.tool()
-def search_news(query: str) -> dict:
-    """Search for news articles using the News API."""
+@traced_tool
+async def search_news(query: str, task_id: str = "", deadline: float = 0, refresh_within: float = 0) -> dict:
+    """
+    Search for news articles using the News API.
+    deadline is the wall-clock time the caller needs an answer by; when the
+    API fails or is unavailable the last cached result is returned, marked stale.
+    refresh_within refetches a cached result that expires within that many
+    seconds (used by the pre-warm scheduler).
+    """
+    key = query.strip().lower()
+    return await news_cache.get_or_fetch(key, lambda: _fetch_news(query, deadline), cache_if=is_cacheable,
+                                         stale_ok=True, refresh_within=refresh_within)
+
+async def _fetch_news(query: str, deadline: float = 0) -> dict:
+    data = await _fetch_articles(query, 1, deadline)
+    if "error" in data:
+        return data
+    if not data["articles"]:
+        return {"error": "No news articles found for the given query."}
+    return _article_fields(data["articles"][0])
+
+async def _fetch_articles(query: str, page_size: int, deadline: float = 0) -> dict:
+    """
+    Raw NewsAPI articles for query, as {"articles": [...]} or {"error": ...}.
+    """
     api_key = os.getenv("NEWSAPI_KEY")
     if not api_key:
         return {"error": "NEWSAPI_KEY is not set in environment variables."}
 
-    url = "https://newsapi.org/v2/everything"
+    url = f"{NEWSAPI_BASE_URL}/v2/everything"
     params = {
         "q": query,
         "apiKey": api_key,
-        "pageSize": 1,
+        "pageSize": page_size,
         "sortBy": "relevancy"
     }
 
     try:
-        response = requests.get(url, params=params)
+        response = await upstream_get("newsapi", url, key=api_key, deadline=deadline, params=params)
         response.raise_for_status()
         
         data = response.json()
         
-        if not data.get("articles"):
-            return {"error": "No news articles found for the given query."}
-            
-        first_article = data["articles"][0]
-        
-        return {
-            "headline": first_article.get("title"),
-            "description": first_article.get("description"),
-            "source": first_article.get("source", {}).get("name"),
-            "url": first_article.get("url"),
-            "published_date": first_article.get("publishedAt")
-        }
+        # Articles taken down at the source come back as "[Removed]" placeholders
+        articles = [a for a in data.get("articles") or [] if a.get("title") and a.get("title") != "[Removed]"]
+        return {"articles": articles}
         
-    except requests.exceptions.RequestException as e:
+    except UpstreamUnavailable as e:
+        return {"error": str(e)}
+    except httpx.HTTPError as e:
         return {"error": f"HTTP error occurred: {str(e)}"}
 
+def _article_fields(article: dict) -> dict:
+    return {
+        "headline": article.get("title"),
+        "description": article.get("description"),
+        "source": (article.get("source") or {}).get("name"),
+        "url": article.get("url"),
+        "published_date": article.get("publishedAt")
+    }
+
+def _or_query(topics: list) -> str:
+    return " OR ".join(f"({topic})" for topic in topics)
+
+def _group_topics(topics: list) -> list:
+    """
+    Packs topics into as few OR queries as the topic and length limits allow.
+    """
+    groups = [[]]
+    for topic in topics:
+        candidate = groups[-1] + [topic]
+        if groups[-1] and (len(candidate) > NEWS_BATCH_MAX_TOPICS
+                           or len(_or_query(candidate)) > NEWS_MAX_QUERY_CHARS):
+            groups.append([topic])
+        else:
+            groups[-1] = candidate
+    return [group for group in groups if group]
+
+def _rank(topic: str, articles: list) -> list:
+    """
+    The articles that mention every word of topic, best match first: words
+    in the headline count double, and ties keep NewsAPI's relevancy order.
+    """
+    terms = set(_WORD.findall(topic.lower()))
+    scored = []
+    for position, article in enumerate(articles):
+        title = set(_WORD.findall((article.get("title") or "").lower()))
+        text = " ".join(article.get(field) or "" for field in ("description", "content"))
+        body = set(_WORD.findall(text.lower()))
+        if not terms <= title | body:
+            continue
+        score = sum(2 if term in title else 1 for term in terms)
+        scored.append((-score, position, article))
+    scored.sort(key=lambda entry: entry[:2])
+    return [article for _, _, article in scored]
+
+def _dedupe_keys(article: dict) -> set:
+    """
+    Keys shared by syndicated copies of one story: the URL without scheme,
+    "www.", query or fragment, and a hash of the headline's words without a
+    trailing source name.
+    """
+    keys = set()
+    url = urlsplit((article.get("url") or "").strip().lower())
+    if url.netloc:
+        host = url.netloc[4:] if url.netloc.startswith("www.") else url.netloc
+        keys.add("url:" + host + url.path.rstrip("/"))
+    words = _WORD.findall(_SOURCE_SUFFIX.sub("", article.get("title") or "").lower())
+    if words:
+        keys.add("title:" + hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest())
+    return keys
+
+def _dedupe(articles: list) -> list:
+    seen = set()
+    unique = []
+    for article in articles:
+        keys = _dedupe_keys(article)
+        if keys & seen:
+            continue
+        seen |= keys
+        unique.append(article)
+    return unique
+
+def _topic_result(topic: str, articles: list, per_topic: int, shared: bool) -> dict:
+    """
+    The top per_topic articles for topic. A page shared by several topics
+    is split between them by _rank; a page of its own keeps NewsAPI's order.
+    """
+    top = _dedupe(_rank(topic, articles) if shared else articles)[:per_topic]
+    if not top:
+        return {"error": "No news articles found for the given query."}
+    return {**_article_fields(top[0]), "articles": [_article_fields(a) for a in top]}
+
+async def _fetch_batch(batch: dict, per_topic: int, deadline: float) -> int:
+    """
+    Fetches the topics in batch (topic -> future for its result) with shared
+    OR queries and resolves their futures. Returns the requests made.
+    """
+    results = {}
+    groups = _group_topics(list(batch))
+    requests = len(groups)
+    fetched = await asyncio.gather(
+        *(_fetch_articles(_or_query(group), NEWS_BATCH_PAGE_SIZE, deadline) for group in groups)
+    )
+    for group, data in zip(groups, fetched):
+        for topic in group:
+            shared = len(group) > 1
+            results[topic] = data if "error" in data else _topic_result(topic, data["articles"], per_topic, shared)
+
+    # A busy topic can crowd the others out of a shared page
+    crowded_out = [t for group in groups if len(group) > 1 for t in group
+                   if "error" in results[t] and "No news" in results[t]["error"]]
+    if crowded_out:
+        requests += len(crowded_out)
+        fetched = await asyncio.gather(
+            *(_fetch_articles(topic, max(per_topic * 3, 10), deadline) for topic in crowded_out)
+        )
+        for topic, data in zip(crowded_out, fetched):
+            results[topic] = data if "error" in data else _topic_result(topic, data["articles"], per_topic, False)
+
+    for topic, future in batch.items():
+        future.set_result(results[topic])
+    return requests
+
+@mcp.tool()
+@traced_tool
+async def search_news_batch(queries: list[str], per_topic: int = 3, task_id: str = "", deadline: float = 0) -> dict:
+    """
+    Search news for many topics with as few News API requests as possible.
+    Topics are OR-ed together into shared queries with large pages, and the
+    articles are split between topics locally: ranked by how well they match,
+    de-duplicated (syndicated copies share a normalized URL or headline) and
+    cut to the top per_topic. Topics the shared queries found nothing for get
+    a query of their own, whose results keep NewsAPI's relevancy order like
+    a single-topic query. Results are cached per topic and per_topic, and
+    concurrent batches looking up the same topic share one fetch.
+    Returns {"results": {topic: top article fields plus "articles"}, "requests": upstream requests made}.
+    """
+    # Topics differing only in case or spacing share one lookup
+    topics = {}
+    for query in queries:
+        if query.strip():
+            topics.setdefault(query.strip().lower(), query.strip())
+
+    # Each topic goes through the cache on its own, so hits and fetches
+    # already in flight for another batch with the same per_topic are
+    # shared (search_news caches single articles under its own keys).
+    # The misses left for this call wait on one batch fetched below.
+    batch = {}
+
+    async def fetch(topic):
+        batch[topic] = asyncio.get_running_loop().create_future()
+        return await batch[topic]
+
+    lookups = [
+        asyncio.ensure_future(news_cache.get_or_fetch(f"{topic.lower()}|top{per_topic}", lambda t=topic: fetch(t),
+                                                      cache_if=is_cacheable, stale_ok=True))
+        for topic in topics.values()
+    ]
+    # One pass of the loop lets every lookup hit, join a fetch or join the batch
+    await asyncio.sleep(0)
+
+    requests = 0
+    try:
+        if batch:
+            try:
+                requests = await _fetch_batch(batch, per_topic, deadline)
+            except Exception as e:
+                for future in batch.values():
+                    if not future.done():
+                        future.set_exception(e)
+        values = await asyncio.gather(*lookups)
+    finally:
+        for future in list(batch.values()) + lookups:
+            future.cancel()
+    results = dict(zip(topics.values(), values))
+
+    by_query = {q: results[topics[q.strip().lower()]] for q in queries if q.strip()}
+    return {"results": by_query, "requests": requests}
+
 @mcp.tool()
-def get_weather(city: str, units: str = "metric") -> dict:
-    """Get the current weather for a city."""
+@traced_tool
+async def get_weather(city: str, units: str = "metric", task_id: str = "", deadline: float = 0,
+                      refresh_within: float = 0) -> dict:
+    """
+    Get the current weather for a city.
+    Falls back to the last cached reading, marked stale, when the API fails.
+    """
+    key = f"{city.strip().lower()}|{units}"
+    return await weather_cache.get_or_fetch(key, lambda: _fetch_weather(city, units, deadline),
+                                            cache_if=is_cacheable, stale_ok=True, refresh_within=refresh_within)
+
+async def _fetch_weather(city: str, units: str, deadline: float = 0) -> dict:
     api_key = os.getenv("OPENWEATHER_API_KEY")
     if not api_key:
         return {"error": "OPENWEATHER_API_KEY is not set in environment variables."}
 
-    url = "https://api.openweathermap.org/data/2.5/weather"
+    url = f"{OPENWEATHER_BASE_URL}/data/2.5/weather"
     params = {
         "q": city,
         "appid": api_key,
@@ -68,7 +295,7 @@ def get_weather(city: str, units: str = "metric") -> dict:
     }
 
     try:
-        response = requests.get(url, params=params)
+        response = await upstream_get("openweather", url, key=api_key, deadline=deadline, params=params)
         
         # Handle specific HTTP errors
         if response.status_code == 401:
@@ -94,7 +321,9 @@ def get_weather(city: str, units: str = "metric") -> dict:
             "country": data.get("sys", {}).get("country")
         }
         
-    except requests.exceptions.RequestException as e:
+    except UpstreamUnavailable as e:
+        return {"error": str(e)}
+    except httpx.HTTPError as e:
         return {"error": f"HTTP error occurred: {str(e)}"}
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import uuid
+from synapse.common.codec import loads_json
+from synapse.common.deadline import remaining, resolve_deadline
+from synapse.protocol.payload_store import share
+from synapse.protocol.post_office import clear_messages
+from synapse.protocol.session_pool import get_session_pool
+from synapse.protocol.work_queue import AGENT_DISPATCH, dispatch
+
+# Client-side helpers for driving the Scout -> Publisher pipeline.
+# Shared by the Streamlit app's background worker and headless runners;
+# calls go through the session pool of the running event loop, or with
+# AGENT_DISPATCH=queue become post office jobs for the agent workers.
+
+# Upstream Agent URLs
+SCOUT_AGENT_URL = "http://127.0.0.1:8004/sse"
+PUBLISHER_AGENT_URL = "http://127.0.0.1:8005/sse"
+
+# Extra time given to Scout past the brief's deadline to report what it has
+SCOUT_REPLY_GRACE_SECONDS = 5
+
+# Seconds to wait for a queued publish job
+PUBLISH_JOB_TIMEOUT = 120
+
+async def run_scout(topic: str, city: str, task_id: str = None, deadline: float = None) -> dict:
+    """
+    Call the Scout Agent to orchestrate data gathering and aggregation.
+    deadline (wall-clock seconds) bounds the whole gathering and defaults
+    to BRIEF_DEADLINE_SECONDS from now.
+    """
+    deadline = resolve_deadline(deadline)
+    arguments = {"topic": topic, "city": city, "deadline": deadline}
+    if AGENT_DISPATCH == "queue":
+        task_id = task_id or f"scout-{uuid.uuid4().hex}"
+        # Workers don't clear the mailbox themselves since the job lives there too
+        clear_messages(task_id)
+        arguments["task_id"] = task_id
+        return await dispatch("Scout", "scout", arguments, task_id=task_id,
+                              timeout=remaining(deadline) + SCOUT_REPLY_GRACE_SECONDS)
+    if task_id:
+        arguments["task_id"] = task_id
+    result = await get_session_pool().call_tool(
+        SCOUT_AGENT_URL, "scout", arguments, deadline=deadline + SCOUT_REPLY_GRACE_SECONDS
+    )
+    return loads_json(result.content[0].text)
+
+async def run_publisher(payload: dict, on_text=None) -> dict:
+    """
+    Call the Publisher Agent to generate the final article.
+    When on_text is given the article is streamed and on_text(chunk) is
+    called for each piece of text as the model writes it.
+    """
+    arguments = {"payload": payload, "task_id": payload.get("task_id") or ""}
+    if AGENT_DISPATCH == "queue":
+        # Queued jobs can't stream, so on_text gets the whole article at once
+        arguments["payload"] = share(payload)
+        result = await dispatch("Publisher", "publish_brief", arguments,
+                                task_id=arguments["task_id"] or None, timeout=PUBLISH_JOB_TIMEOUT)
+        if on_text is not None and result.get("article"):
+            on_text(result["article"])
+        return result
+    if on_text is None:
+        result = await get_session_pool().call_tool(PUBLISHER_AGENT_URL, "publish_brief", arguments)
+        return loads_json(result.content[0].text)
+
+    async def on_progress(progress, total, message):
+        if message:
+            on_text(message)
+
+    result = await get_session_pool().call_tool(
+        PUBLISHER_AGENT_URL, "publish_brief_stream", arguments,
+        retries=0, progress_callback=on_progress
+    )
+    return loads_json(result.content[0].text)
+
+async def run_pipeline(topic: str, city: str, on_text=None, task_id: str = None) -> dict:
+    """
+    Run Scout then Publisher for one brief.
+    """
+    scout_data = await run_scout(topic, city, task_id)
+    if "error" in scout_data:
+        return scout_data
+    return await run_publisher(scout_data, on_text)
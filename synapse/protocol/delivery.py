@@ -0,0 +1,203 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import threading
+from synapse.protocol import post_office
+
+# Event-driven delivery on top of the post office.
+#
+# Messages sent from the same process resolve waiting futures directly.
+# Messages written by other processes are picked up through inotify on the
+# mailbox directory, so an idle waiter costs nothing. On platforms without
+# inotify we fall back to cheaply stat-ing the newest segment.
+
+# Fallback check interval when inotify is not available
+STAT_POLL_INTERVAL = 0.05
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+
+class _Waiter:
+    def __init__(self, loop, task_id, status, recipient):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.task_id = task_id
+        self.status = status
+        self.recipient = recipient
+
+    def matches(self, message: dict) -> bool:
+        if message.get("task_id") != self.task_id:
+            return False
+        if self.status is not None and message.get("status") != self.status:
+            return False
+        if self.recipient is not None and message.get("recipient") != self.recipient:
+            return False
+        return True
+
+
+_lock = threading.Lock()
+_waiters = []
+_watchers = {}
+
+
+def _resolve(future, message: dict):
+    if not future.done():
+        future.set_result(message)
+
+
+def _on_local_message(message: dict):
+    """
+    Post office listener: wakes up waiters in this process immediately.
+    """
+    with _lock:
+        matched = [w for w in _waiters if w.matches(message)]
+    for waiter in matched:
+        waiter.loop.call_soon_threadsafe(_resolve, waiter.future, message)
+
+
+post_office.add_listener(_on_local_message)
+
+
+def _check_store(waiter: _Waiter) -> bool:
+    """
+    Looks up the waiter's task in the post office index and resolves it
+    if a matching message has already been written.
+    """
+    for message in post_office.read_messages(task_id=waiter.task_id):
+        if waiter.matches(message):
+            _resolve(waiter.future, message)
+            return True
+    return False
+
+
+def _load_inotify():
+    path = ctypes.util.find_library("c")
+    if not path:
+        return None
+    try:
+        libc = ctypes.CDLL(path, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class _MailboxWatcher:
+    """
+    Watches the mailbox directory on behalf of every waiter on one event loop.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.fd = None
+        self.poll_task = None
+        self.last_seen = None
+
+        os.makedirs(post_office.POST_OFFICE_DIR, exist_ok=True)
+        libc = _load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0:
+                mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+                directory = os.fsencode(post_office.POST_OFFICE_DIR)
+                if libc.inotify_add_watch(fd, directory, mask) >= 0:
+                    self.fd = fd
+                    loop.add_reader(fd, self._on_inotify)
+                else:
+                    os.close(fd)
+
+        if self.fd is None:
+            self.poll_task = loop.create_task(self._poll())
+
+    def _on_inotify(self):
+        # Drain pending events; we only care that something changed
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        self.check()
+
+    def _fingerprint(self):
+        segments = post_office._list_segments()
+        if not segments:
+            return None
+        try:
+            stat = os.stat(post_office._segment_path(segments[-1]))
+        except OSError:
+            return None
+        return (segments[-1], stat.st_size, stat.st_mtime_ns)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(STAT_POLL_INTERVAL)
+            fingerprint = self._fingerprint()
+            if fingerprint != self.last_seen:
+                self.last_seen = fingerprint
+                self.check()
+
+    def check(self):
+        with _lock:
+            pending = [w for w in _waiters if w.loop is self.loop and not w.future.done()]
+        for waiter in pending:
+            _check_store(waiter)
+
+    def close(self):
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
+
+
+def _register(waiter: _Waiter):
+    with _lock:
+        _waiters.append(waiter)
+        if waiter.loop not in _watchers:
+            _watchers[waiter.loop] = None
+            start_watcher = True
+        else:
+            start_watcher = False
+    if start_watcher:
+        watcher = _MailboxWatcher(waiter.loop)
+        with _lock:
+            _watchers[waiter.loop] = watcher
+
+
+def _unregister(waiter: _Waiter):
+    watcher = None
+    with _lock:
+        if waiter in _waiters:
+            _waiters.remove(waiter)
+        if not any(w.loop is waiter.loop for w in _waiters):
+            watcher = _watchers.pop(waiter.loop, None)
+    if watcher is not None:
+        watcher.close()
+
+
+async def wait_for(task_id: str, status: str = None, timeout: float = 30, recipient: str = None) -> dict:
+    """
+    Waits until a message for task_id (and optionally status/recipient) is
+    in the post office and returns it. Returns immediately if a matching
+    message was already sent.
+    """
+    waiter = _Waiter(asyncio.get_running_loop(), task_id, status, recipient)
+    # Register before checking the store so a message sent in between is not missed
+    _register(waiter)
+    try:
+        if not _check_store(waiter):
+            await asyncio.wait_for(waiter.future, timeout)
+        return waiter.future.result()
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Timed out waiting for response with task_id: {task_id}")
+    finally:
+        _unregister(waiter)
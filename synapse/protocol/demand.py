@@ -0,0 +1,112 @@
+import os
+import time
+from synapse.common.codec import dumps_json, loads_json
+
+# Request history for cache pre-warming.
+# Scout appends one line per brief it gathers to a log shared by every
+# agent process (like the post office and payload store, a plain directory
+# or file is all that's needed); the pre-warm scheduler reads it to work out
+# which topic/city pairs are likely to be requested soon.
+
+DEMAND_LOG = os.getenv("DEMAND_LOG", os.path.join(os.path.dirname(__file__), "demand.jsonl"))
+
+# Requests lose half their weight after this many hours
+DEMAND_HALF_LIFE_HOURS = float(os.getenv("DEMAND_HALF_LIFE_HOURS", "72"))
+
+# Requests older than this are ignored and dropped by trim()
+DEMAND_HISTORY_DAYS = float(os.getenv("DEMAND_HISTORY_DAYS", "14"))
+
+# Extra weight for past requests made at the time of day that is coming up,
+# so daily routines ("markets at 8am") are warmed before they recur
+SAME_TIME_WEIGHT = 3.0
+
+# Task ids of the scheduler's own briefs, which are not recorded as demand
+PREWARM_TASK_PREFIX = "prewarm-"
+
+_DAY = 24 * 60 * 60
+
+
+def record(topic: str, city: str, at: float = None):
+    """
+    Appends a request for topic/city to the demand log.
+    """
+    line = dumps_json({"at": round(at or time.time(), 3), "topic": topic.strip(), "city": city.strip()}) + "\n"
+    os.makedirs(os.path.dirname(DEMAND_LOG) or ".", exist_ok=True)
+    # One small O_APPEND write per line, so concurrent writers don't interleave
+    fd = os.open(DEMAND_LOG, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def _read(path: str) -> list:
+    try:
+        with open(path, "rb") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    events = []
+    for line in lines:
+        try:
+            events.append(loads_json(line))
+        except ValueError:
+            continue
+    return events
+
+
+def expected_demand(lead: float = 3600, now: float = None) -> list:
+    """
+    Ranks topic/city pairs by how likely they are to be requested in the
+    next lead seconds. Recent requests count most (see DEMAND_HALF_LIFE_HOURS),
+    and requests made at the upcoming time of day on earlier days count extra.
+    Returns [{"topic", "city", "score", "requests"}], hottest first.
+    """
+    now = now or time.time()
+    half_life = DEMAND_HALF_LIFE_HOURS * 3600
+    history = DEMAND_HISTORY_DAYS * _DAY
+    pairs = {}
+
+    for event in _read(DEMAND_LOG):
+        at = event.get("at", 0)
+        age = now - at
+        if age < 0 or age > history or not event.get("topic"):
+            continue
+        weight = 0.5 ** (age / half_life)
+        # How far ahead this request's time of day is from now's
+        if (at - now) % _DAY <= lead:
+            weight *= 1 + SAME_TIME_WEIGHT
+
+        key = (event["topic"].lower(), event.get("city", "").lower())
+        pair = pairs.setdefault(key, {"topic": event["topic"], "city": event.get("city", ""),
+                                      "score": 0.0, "requests": 0})
+        pair["score"] += weight
+        pair["requests"] += 1
+
+    ranked = sorted(pairs.values(), key=lambda p: p["score"], reverse=True)
+    for pair in ranked:
+        pair["score"] = round(pair["score"], 4)
+    return ranked
+
+
+def trim(history_days: float = DEMAND_HISTORY_DAYS) -> int:
+    """
+    Drops requests older than history_days from the log.
+    Returns the number of requests kept.
+    """
+    if not os.path.exists(DEMAND_LOG):
+        return 0
+    # Move the log aside first so requests recorded meanwhile go to a fresh one
+    old_path = DEMAND_LOG + ".trim"
+    os.replace(DEMAND_LOG, old_path)
+    cutoff = time.time() - history_days * _DAY
+    kept = [event for event in _read(old_path) if event.get("at", 0) >= cutoff]
+    if kept:
+        data = "".join(dumps_json(event) + "\n" for event in kept).encode("utf-8")
+        fd = os.open(DEMAND_LOG, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    os.remove(old_path)
+    return len(kept)
@@ -0,0 +1,40 @@
+import hashlib
+import json
+import os
+import tempfile
+from synapse.common.codec import loads_json
+
+# Latest state per topic/city, shared by every agent process.
+# Scout keeps the signal baseline it diffs new signals against, and the
+# Publisher the article it built from that baseline; each kind is one small
+# JSON file per topic/city, replaced atomically.
+
+HISTORY_DIR = os.getenv("HISTORY_DIR", os.path.join(os.path.dirname(__file__), "history"))
+
+
+def _path(kind: str, topic: str, city: str) -> str:
+    key = f"{topic.strip().lower()}|{city.strip().lower()}"
+    return os.path.join(HISTORY_DIR, kind, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+
+def load(kind: str, topic: str, city: str):
+    """
+    Returns the latest value of kind stored for topic/city, or None.
+    """
+    try:
+        with open(_path(kind, topic, city), "rb") as f:
+            return loads_json(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save(kind: str, topic: str, city: str, value):
+    """
+    Replaces the latest value of kind for topic/city.
+    """
+    path = _path(kind, topic, city)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(temp_path, path)
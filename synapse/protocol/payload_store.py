@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from synapse.common.codec import loads_json
+
+# Content-addressed store for signals passed between agents.
+# A payload is serialized once and written under its SHA-256; agents then
+# pass a small reference ({"$ref": "sha256:<hex>", "size": <bytes>}) through
+# tool results and the post office instead of re-encoding the full signal
+# at every hop. Receivers resolve references only when they need the data.
+# Like the post office, the store is a directory shared by every agent.
+
+PAYLOAD_STORE_DIR = os.getenv("PAYLOAD_STORE_DIR", os.path.join(os.path.dirname(__file__), "payloads"))
+
+# Payloads smaller than this (serialized bytes) are passed inline
+PAYLOAD_INLINE_MAX_BYTES = int(os.getenv("PAYLOAD_INLINE_MAX_BYTES", "512"))
+
+# Payloads not written or re-shared for this long are deleted by prune(),
+# which runs with the post office's maintenance. Keep it longer than the
+# post office retention so messages never outlive the payloads they point to.
+PAYLOAD_RETENTION_SECONDS = int(os.getenv("PAYLOAD_RETENTION_SECONDS", str(7 * 24 * 60 * 60)))
+
+# Decoded payloads kept in memory per process
+_CACHE_SIZE = 256
+
+_REF_KEY = "$ref"
+_PREFIX = "sha256:"
+
+_cache = OrderedDict()  # digest -> decoded payload
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _path(digest: str) -> str:
+    return os.path.join(PAYLOAD_STORE_DIR, digest[:2], f"{digest}.json")
+
+
+def _remember(digest: str, value):
+    _cache[digest] = value
+    _cache.move_to_end(digest)
+    while len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def is_ref(value) -> bool:
+    """
+    True if value is a payload reference.
+    """
+    return isinstance(value, dict) and isinstance(value.get(_REF_KEY), str) and value[_REF_KEY].startswith(_PREFIX)
+
+
+def put(value) -> dict:
+    """
+    Stores value (anything JSON-serializable) and returns its reference.
+    Storing the same content again is a no-op.
+    """
+    data = _encode(value)
+    digest = hashlib.sha256(data).hexdigest()
+    path = _path(digest)
+    if os.path.exists(path):
+        # Refresh the timestamp so prune() keeps payloads that are still in use
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial payload
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    _remember(digest, value)
+    return {_REF_KEY: _PREFIX + digest, "size": len(data)}
+
+
+def share(value, inline_max_bytes: int = None):
+    """
+    Returns value itself when it is small, otherwise stores it and returns
+    a reference. Existing references are passed through unchanged.
+    """
+    if is_ref(value):
+        return value
+    limit = PAYLOAD_INLINE_MAX_BYTES if inline_max_bytes is None else inline_max_bytes
+    if len(_encode(value)) <= limit:
+        return value
+    return put(value)
+
+
+def get(ref: dict):
+    """
+    Loads the payload a reference points to.
+    Raises KeyError if it is not in the store.
+    """
+    digest = ref[_REF_KEY][len(_PREFIX):]
+    if digest in _cache:
+        _cache.move_to_end(digest)
+        return _cache[digest]
+    try:
+        with open(_path(digest), "rb") as f:
+            value = loads_json(f.read())
+    except FileNotFoundError:
+        raise KeyError(f"Payload {ref[_REF_KEY]} not found in the payload store")
+    _remember(digest, value)
+    return value
+
+
+def resolve(value):
+    """
+    Returns the payload for a reference, or value unchanged if it isn't one.
+    """
+    return get(value) if is_ref(value) else value
+
+
+def prune(retention_seconds: float = PAYLOAD_RETENTION_SECONDS) -> int:
+    """
+    Deletes payloads not written in the last retention_seconds.
+    Returns the number removed.
+    """
+    cutoff = time.time() - retention_seconds
+    removed = 0
+    if not os.path.isdir(PAYLOAD_STORE_DIR):
+        return removed
+    for shard in os.listdir(PAYLOAD_STORE_DIR):
+        shard_dir = os.path.join(PAYLOAD_STORE_DIR, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for name in os.listdir(shard_dir):
+            path = os.path.join(shard_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    _cache.pop(name.split(".")[0], None)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
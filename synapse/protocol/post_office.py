@@ -1,24 +1,301 @@
 import json
 import os
-from datetime import datetime
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from synapse.common.codec import encode_frame, get_codec, read_frame
+from synapse.protocol import payload_store
 
-# Path to the shared message store
-POST_OFFICE_FILE = os.path.join(os.path.dirname(__file__), "post_office.json")
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
 
-def _ensure_file():
+# Directory holding the append-only message log.
+# Each segment ("segment-000001.log") is a sequence of framed envelopes (see
+# synapse.common.codec) with a sidecar JSON Lines index ("segment-000001.idx")
+# recording the byte offset, task_id and recipient of every record, so
+# readers can seek straight to what they need.
+POST_OFFICE_DIR = os.getenv("POST_OFFICE_DIR", os.path.join(os.path.dirname(__file__), "mailbox"))
+
+# Codec for new envelopes (default: SYNAPSE_CODEC, else JSON); readers
+# handle every codec, and plain JSON lines from older segments
+POST_OFFICE_CODEC = os.getenv("POST_OFFICE_CODEC")
+
+# Schema version of the envelopes this code writes. Readers skip envelopes
+# from newer writers rather than misreading them.
+ENVELOPE_VERSION = 1
+
+# Start a new segment once the active one grows past this size
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+
+# Sealed segments whose newest message is older than this are deleted when
+# the log is compacted
+RETENTION_SECONDS = int(os.getenv("POST_OFFICE_RETENTION_SECONDS", str(24 * 60 * 60)))
+
+# The log is compacted whenever a segment fills up, and otherwise at most
+# this often. The modification time of _COMPACT_MARKER records the last run,
+# so only one of the processes sharing the mailbox runs it per interval.
+COMPACT_INTERVAL_SECONDS = int(os.getenv("POST_OFFICE_COMPACT_INTERVAL", "3600"))
+_COMPACT_MARKER = ".compacted"
+
+# Seconds between this process's checks of the marker
+_MAINTENANCE_CHECK_SECONDS = 60
+
+_SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.log$")
+
+# Compaction rewrites a sealed segment only when at least this share of its
+# records belongs to cleared tasks; other sealed segments are left alone
+# until they expire, so a message is rarely copied more than once.
+_COMPACT_MIN_CLEARED_RATIO = 0.25
+
+# Suffix of a segment's replacement files while compaction builds them
+_NEW_SUFFIX = ".new"
+
+# Per-task cleanup is recorded as tombstones rather than rewriting segments.
+# Each line holds a task_id and the log position (segment, offset) at the
+# time it was cleared; older records for that task are hidden from readers
+# and physically dropped on the next compaction.
+_TOMBSTONE_FILE = "tombstones.log"
+
+# Writers serialize on an exclusive flock of this file so that many agent
+# processes can append to the same mailbox without interleaving records.
+_LOCK_FILE = ".lock"
+_thread_lock = threading.Lock()
+
+# Compactions serialize on their own lock, so they can read and rewrite
+# segments without holding up senders
+_COMPACT_LOCK_FILE = ".compact.lock"
+_compact_thread_lock = threading.Lock()
+
+# In-process cache of parsed sidecar indexes, keyed by segment number.
+# Each entry remembers how far into the .idx file it has read so that only
+# newly appended index lines are parsed on the next lookup, and the inode it
+# was read from so a segment rewritten by compaction is re-indexed.
+_index_cache = {}
+
+# In-process cache of parsed tombstones: task_id -> (segment, offset)
+_tombstone_cache = {"ino": None, "pos": 0, "tasks": {}}
+
+# Callbacks invoked with every message sent from this process
+_listeners = []
+
+# Held while this process runs maintenance in the background
+_maintenance_lock = threading.Lock()
+_next_maintenance_check = 0.0
+
+
+def _segment_path(number: int) -> str:
+    return os.path.join(POST_OFFICE_DIR, f"segment-{number:06d}.log")
+
+
+def _index_path(number: int) -> str:
+    return os.path.join(POST_OFFICE_DIR, f"segment-{number:06d}.idx")
+
+
+def _ensure_store():
+    """
+    Ensures that the mailbox directory exists.
+    """
+    os.makedirs(POST_OFFICE_DIR, exist_ok=True)
+
+
+def _locked():
+    """
+    Holds the mailbox write lock across threads and processes.
+    """
+    return _file_locked(_LOCK_FILE, _thread_lock)
+
+
+@contextmanager
+def _file_locked(name: str, thread_lock: threading.Lock):
+    _ensure_store()
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(POST_OFFICE_DIR, name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _list_segments() -> list:
+    """
+    Returns the segment numbers currently on disk, oldest first.
+    """
+    _ensure_store()
+    numbers = []
+    for name in os.listdir(POST_OFFICE_DIR):
+        match = _SEGMENT_PATTERN.match(name)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+
+def _active_segment() -> int:
+    """
+    Returns the segment new messages should be appended to,
+    rotating to a fresh segment when the current one is full.
+    """
+    segments = _list_segments()
+    if not segments:
+        return 1
+
+    current = segments[-1]
+    try:
+        size = os.path.getsize(_segment_path(current))
+    except OSError:
+        size = 0
+
+    if size >= SEGMENT_MAX_BYTES:
+        return current + 1
+    return current
+
+
+def _append_record(log_path: str, index_path: str, message: dict):
+    """
+    Appends a single record to a segment and its sidecar index.
+    """
+    record = encode_frame(message, ENVELOPE_VERSION, get_codec(POST_OFFICE_CODEC))
+
+    with open(log_path, "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.write(record)
+
+    entry = {
+        "o": offset,
+        "t": message.get("task_id"),
+        "r": message.get("recipient"),
+    }
+    with open(index_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def _load_index(number: int) -> dict:
+    """
+    Returns the parsed index for a segment, reading only the index lines
+    appended since the last call.
+    """
+    path = _index_path(number)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _index_cache.pop(number, None)
+        return {"ino": None, "pos": 0, "offsets": [], "task_id": {}, "recipient": {}}
+
+    cached = _index_cache.get(number)
+    if cached is None or cached["ino"] != stat.st_ino or cached["pos"] > stat.st_size:
+        cached = {"ino": stat.st_ino, "pos": 0, "offsets": [], "task_id": {}, "recipient": {}}
+        _index_cache[number] = cached
+
+    if cached["pos"] < stat.st_size:
+        with open(path, "r", encoding="utf-8") as f:
+            f.seek(cached["pos"])
+            for line in f:
+                # Skip a partially written trailing line; it is picked up next time
+                if not line.endswith("\n"):
+                    break
+                cached["pos"] += len(line.encode("utf-8"))
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                offset = entry["o"]
+                cached["offsets"].append(offset)
+                cached["task_id"].setdefault(entry.get("t"), []).append(offset)
+                cached["recipient"].setdefault(entry.get("r"), []).append(offset)
+
+    return cached
+
+
+def _load_tombstones() -> dict:
+    """
+    Returns task_id -> (segment, offset) for every cleared task, reading
+    only the tombstone lines appended since the last call.
+    """
+    cache = _tombstone_cache
+    path = os.path.join(POST_OFFICE_DIR, _TOMBSTONE_FILE)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        cache.update(ino=None, pos=0, tasks={})
+        return cache["tasks"]
+
+    if cache["ino"] != stat.st_ino or cache["pos"] > stat.st_size:
+        cache.update(ino=stat.st_ino, pos=0, tasks={})
+
+    if cache["pos"] < stat.st_size:
+        with open(path, "r", encoding="utf-8") as f:
+            f.seek(cache["pos"])
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                cache["pos"] += len(line.encode("utf-8"))
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                position = (entry["s"], entry["o"])
+                previous = cache["tasks"].get(entry["t"])
+                if previous is None or position > previous:
+                    cache["tasks"][entry["t"]] = position
+
+    return cache["tasks"]
+
+
+def _is_cleared(tombstones: dict, task_id, number: int, offset: int) -> bool:
+    cleared_at = tombstones.get(task_id)
+    return cleared_at is not None and (number, offset) < cleared_at
+
+
+def _open_envelope(frame):
+    """
+    Returns the message in a frame read by read_frame, or None if it is
+    missing, undecodable or from a newer schema version.
+    Version 0 (unframed JSON lines) has the same fields as version 1.
+    """
+    if frame is None:
+        return None
+    message, version = frame
+    if not isinstance(message, dict) or version > ENVELOPE_VERSION:
+        return None
+    return message
+
+
+def _read_at(f, offset: int):
+    """
+    Reads the record starting at the given byte offset.
+    """
+    f.seek(offset)
+    return _open_envelope(read_frame(f))
+
+
+def add_listener(callback):
+    """
+    Registers a callback that is invoked with every message sent from this
+    process, right after it has been written to the log.
+    """
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
     """
-    Ensures that the post_office.json file exists.
-    If it doesn't exist, initializes it with an empty list.
+    Unregisters a callback previously added with add_listener.
     """
-    if not os.path.exists(POST_OFFICE_FILE):
-        with open(POST_OFFICE_FILE, 'w') as f:
-            json.dump([], f)
+    if callback in _listeners:
+        _listeners.remove(callback)
+
 
 def send_message(message: dict):
     """
-    Sends a message by appending it to the post_office.json file.
+    Sends a message by appending it to the active log segment.
     Adds a timestamp automatically before saving.
-    
+
     Expected message fields (from schema.json):
     - sender (str)
     - recipient (str)
@@ -26,39 +303,365 @@ def send_message(message: dict):
     - status (str)
     - payload (dict)
     """
-    _ensure_file()
-    
     # Attach timestamp for reliable ordering
     message["timestamp"] = datetime.utcnow().isoformat()
-    
+
     try:
-        # Read current messages
-        messages = read_messages()
-        
-        # Append the new envelope
-        messages.append(message)
-        
-        # Write updated list back to disk
-        with open(POST_OFFICE_FILE, 'w') as f:
-            json.dump(messages, f, indent=4)
-            
+        with _locked():
+            number = _active_segment()
+            rotated = number > 1 and not os.path.exists(_segment_path(number))
+            _append_record(_segment_path(number), _index_path(number), message)
     except Exception as e:
         print(f"Error sending message: {e}")
+        return
+
+    _schedule_maintenance(rotated)
+
+    for callback in list(_listeners):
+        try:
+            callback(message)
+        except Exception as e:
+            print(f"Error notifying listener: {e}")
+
+
+def read_messages(task_id: str = None, recipient: str = None) -> list:
+    """
+    Returns messages from the post office in the order they were sent.
+    When task_id and/or recipient are given, only matching messages are
+    read, using the sidecar index to seek directly to them.
+    """
+    messages = []
+    tombstones = _load_tombstones()
+    for number in _list_segments():
+        index = _load_index(number)
+
+        offsets = index["offsets"]
+        if task_id is not None:
+            offsets = index["task_id"].get(task_id, [])
+        if recipient is not None:
+            by_recipient = index["recipient"].get(recipient, [])
+            if task_id is not None:
+                wanted = set(by_recipient)
+                offsets = [o for o in offsets if o in wanted]
+            else:
+                offsets = by_recipient
+
+        if not offsets:
+            continue
+
+        try:
+            with open(_segment_path(number), "rb") as f:
+                for offset in offsets:
+                    record = _read_at(f, offset)
+                    if record is None:
+                        continue
+                    # An index read just before compaction swapped the
+                    # segment can point at other records; skip those
+                    if task_id is not None and record.get("task_id") != task_id:
+                        continue
+                    if recipient is not None and record.get("recipient") != recipient:
+                        continue
+                    if _is_cleared(tombstones, record.get("task_id"), number, offset):
+                        continue
+                    messages.append(record)
+        except OSError:
+            continue
+
+    return messages
+
+
+def read_new(recipient: str, cursor: dict = None) -> tuple:
+    """
+    Incremental read_messages(recipient=...) for consumers that fold
+    messages into their own state. Returns (messages, cursor, reset): the
+    messages for recipient appended since cursor was returned, and the
+    cursor to pass next time. With no cursor, or when the log has been
+    compacted or cleared since, every message is returned and reset is True,
+    meaning state built from earlier calls should be discarded.
+    """
+    tombstones = _load_tombstones()
+    segments = _list_segments()
+    indexes = {number: _load_index(number) for number in segments}
+
+    # cursor: segment number -> [index inode, recipient records already read]
+    reset = cursor is None or any(
+        number not in indexes or indexes[number]["ino"] != ino for number, (ino, _) in cursor.items()
+    )
+    positions = {} if reset else cursor
+
+    messages = []
+    next_cursor = {}
+    for number in segments:
+        index = indexes[number]
+        if index["ino"] is None:
+            continue
+        offsets = index["recipient"].get(recipient, [])
+        start = positions.get(number, (None, 0))[1]
+        if start < len(offsets):
+            try:
+                with open(_segment_path(number), "rb") as f:
+                    for offset in offsets[start:]:
+                        record = _read_at(f, offset)
+                        if record is None or record.get("recipient") != recipient:
+                            continue
+                        if _is_cleared(tombstones, record.get("task_id"), number, offset):
+                            continue
+                        messages.append(record)
+            except OSError:
+                # Unreadable for now; retried from the same position next time
+                if number in positions:
+                    next_cursor[number] = positions[number]
+                continue
+        next_cursor[number] = [index["ino"], len(offsets)]
+
+    return messages, next_cursor, reset
+
+
+def clear_messages(task_id: str = None):
+    """
+    Removes messages from the store.
+    With a task_id only that task's messages are cleared, leaving other
+    in-flight tasks untouched; without one the whole store is reset.
+    """
+    with _locked():
+        if task_id is None:
+            _remove_segments(_list_segments())
+            tombstone_path = os.path.join(POST_OFFICE_DIR, _TOMBSTONE_FILE)
+            if os.path.exists(tombstone_path):
+                os.remove(tombstone_path)
+            return
+
+        number = _active_segment()
+        try:
+            offset = os.path.getsize(_segment_path(number))
+        except OSError:
+            offset = 0
+
+        entry = {"t": task_id, "s": number, "o": offset}
+        with open(os.path.join(POST_OFFICE_DIR, _TOMBSTONE_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def _remove_segments(numbers: list):
+    for number in numbers:
+        _remove_files(_segment_path(number), _index_path(number))
+        _index_cache.pop(number, None)
+
+
+def _parse_timestamp(message: dict):
+    try:
+        return datetime.fromisoformat(message.get("timestamp", ""))
+    except (TypeError, ValueError):
+        return None
+
 
-def read_messages() -> list:
+def compact(retention_seconds: int = RETENTION_SECONDS):
     """
-    Returns all messages from the post_office.json file.
+    Reclaims space from the sealed segments; the active segment is left
+    untouched. Segments whose newest message is older than the retention
+    window are deleted whole, and segments made up largely of cleared tasks'
+    messages are rewritten without them. Other segments are not touched.
+    Segments are read and rewritten without holding the write lock; senders
+    only wait while a finished segment is swapped in.
     """
-    _ensure_file()
+    with _file_locked(_COMPACT_LOCK_FILE, _compact_thread_lock):
+        with _locked():
+            _recover_compaction()
+
+        cutoff = time.time() - retention_seconds
+        for number in _list_segments()[:-1]:
+            try:
+                stat = os.stat(_segment_path(number))
+            except OSError:
+                continue
+            if stat.st_mtime < cutoff:
+                with _locked():
+                    if _same_file(_segment_path(number), stat):
+                        _remove_segments([number])
+            elif _worth_rewriting(number):
+                _rewrite_segment(number, stat, cutoff)
+
+        with _locked():
+            _prune_tombstones()
+
+
+def _same_file(path: str, stat: os.stat_result) -> bool:
+    # False once the segment was removed, e.g. by clear_messages()
     try:
-        with open(POST_OFFICE_FILE, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, Exception):
-        return []
+        return os.stat(path).st_ino == stat.st_ino
+    except OSError:
+        return False
+
 
-def clear_messages():
+def _worth_rewriting(number: int) -> bool:
     """
-    Resets the message store to an empty list.
+    Whether enough of a sealed segment's records belong to cleared tasks.
+    Segments holding messages sent after a clear that is recorded in the
+    same segment are kept as they are: rewriting would move those messages
+    to offsets the tombstone hides.
     """
-    with open(POST_OFFICE_FILE, 'w') as f:
-        json.dump([], f)
+    index = _load_index(number)
+    if not index["offsets"]:
+        return False
+    tombstones = _load_tombstones()
+    cleared = 0
+    for task_id, offsets in index["task_id"].items():
+        cleared_at = tombstones.get(task_id)
+        if cleared_at is None:
+            continue
+        if cleared_at[0] == number and offsets[-1] >= cleared_at[1]:
+            return False
+        cleared += sum(1 for offset in offsets if (number, offset) < cleared_at)
+    return cleared >= len(index["offsets"]) * _COMPACT_MIN_CLEARED_RATIO
+
+
+def _rewrite_segment(number: int, stat: os.stat_result, cutoff: float):
+    """
+    Rewrites one sealed segment without cleared or expired messages.
+    The replacement is built next to it and swapped in under the write lock.
+    """
+    log_path, index_path = _segment_path(number), _index_path(number)
+    new_log, new_index = log_path + _NEW_SUFFIX, index_path + _NEW_SUFFIX
+    expired_before = datetime.utcfromtimestamp(cutoff)
+    tombstones = _load_tombstones()
+
+    survivors = 0
+    try:
+        with open(log_path, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != stat.st_ino:
+                return
+            while True:
+                record_offset = f.tell()
+                frame = read_frame(f)
+                if frame is None:
+                    break
+                record = _open_envelope(frame)
+                if record is None:
+                    continue
+                if _is_cleared(tombstones, record.get("task_id"), number, record_offset):
+                    continue
+                sent_at = _parse_timestamp(record)
+                if sent_at is None or sent_at >= expired_before:
+                    _append_record(new_log, new_index, record)
+                    survivors += 1
+        if survivors:
+            # Keep the age of the segment for retention
+            os.utime(new_log, (stat.st_atime, stat.st_mtime))
+    except OSError:
+        _remove_files(new_log, new_index)
+        return
+
+    with _locked():
+        if not _same_file(log_path, stat):
+            _remove_files(new_log, new_index)
+        elif not survivors:
+            _remove_segments([number])
+        else:
+            # Log first, then index; _recover_compaction finishes the swap
+            # if the process dies in between
+            os.replace(new_log, log_path)
+            os.replace(new_index, index_path)
+            _index_cache.pop(number, None)
+
+
+def _recover_compaction():
+    """
+    Cleans up after a compaction that was interrupted. A replacement index
+    without its log means the log was already swapped in, so the index
+    follows; anything else is an unfinished rewrite and is discarded.
+    Must hold the write lock.
+    """
+    names = set(os.listdir(POST_OFFICE_DIR))
+    for name in names:
+        if not name.endswith(_NEW_SUFFIX):
+            continue
+        path = os.path.join(POST_OFFICE_DIR, name)
+        base = name[:-len(_NEW_SUFFIX)]
+        if base.endswith(".idx") and base[:-len(".idx")] + ".log" + _NEW_SUFFIX not in names:
+            os.replace(path, os.path.join(POST_OFFICE_DIR, base))
+        else:
+            os.remove(path)
+
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _prune_tombstones():
+    """
+    Drops tombstones that no longer hide any record. Must hold the write lock.
+    """
+    tombstones = _load_tombstones()
+    indexes = [(number, _load_index(number)) for number in _list_segments()]
+
+    def hides_records(task_id, cleared_at):
+        for number, index in indexes:
+            if number > cleared_at[0]:
+                break
+            offsets = index["task_id"].get(task_id)
+            if offsets and (number, offsets[0]) < cleared_at:
+                return True
+        return False
+
+    kept = {task: position for task, position in tombstones.items() if hides_records(task, position)}
+    if len(kept) < len(tombstones):
+        _rewrite_tombstones(kept)
+
+
+def _rewrite_tombstones(tasks: dict):
+    path = os.path.join(POST_OFFICE_DIR, _TOMBSTONE_FILE)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for task, (number, offset) in tasks.items():
+            entry = {"t": task, "s": number, "o": offset}
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    os.replace(temp_path, path)
+
+
+def run_maintenance(retention_seconds: int = RETENTION_SECONDS):
+    """
+    Compacts the log and prunes the payload store its messages point into.
+    Runs automatically from send_message (see COMPACT_INTERVAL_SECONDS);
+    can also be called from a cron job.
+    """
+    compact(retention_seconds)
+    payload_store.prune()
+
+
+def _schedule_maintenance(rotated: bool):
+    """
+    Starts run_maintenance in a background thread when a segment was just
+    sealed or the last run (by any process) is older than COMPACT_INTERVAL_SECONDS.
+    """
+    global _next_maintenance_check
+    now = time.time()
+    if not rotated:
+        if now < _next_maintenance_check:
+            return
+        _next_maintenance_check = now + _MAINTENANCE_CHECK_SECONDS
+        try:
+            if now - os.path.getmtime(os.path.join(POST_OFFICE_DIR, _COMPACT_MARKER)) < COMPACT_INTERVAL_SECONDS:
+                return
+        except OSError:
+            pass
+
+    if not _maintenance_lock.acquire(blocking=False):
+        return
+    # Claim this interval before starting so other processes skip it
+    with open(os.path.join(POST_OFFICE_DIR, _COMPACT_MARKER), "a"):
+        pass
+    os.utime(os.path.join(POST_OFFICE_DIR, _COMPACT_MARKER))
+
+    def run():
+        try:
+            run_maintenance()
+        except Exception as e:
+            print(f"Error in post office maintenance: {e}")
+        finally:
+            _maintenance_lock.release()
+
+    threading.Thread(target=run, name="post-office-maintenance", daemon=True).start()
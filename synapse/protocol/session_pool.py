@@ -0,0 +1,192 @@
+import asyncio
+import os
+import weakref
+from datetime import timedelta
+from mcp.client.session import ClientSession
+from mcp.client.sse import sse_client
+from mcp.shared.exceptions import McpError
+from synapse.common.codec import loads_json
+from synapse.common.deadline import remaining
+from synapse.common.tracing import span
+
+# Shared pool of long-lived MCP client sessions, keyed by server URL.
+# Every agent and the UI call tools through the pool so the SSE handshake
+# and initialize() round trip are paid once per process instead of per call.
+
+# Maximum number of concurrent in-flight tool calls per session
+MAX_IN_FLIGHT = int(os.getenv("MCP_SESSION_MAX_IN_FLIGHT", "8"))
+
+# How often idle sessions are pinged to detect dead connections (seconds)
+HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_SESSION_HEALTH_CHECK_INTERVAL", "30"))
+
+
+def extract_data(result):
+    """
+    Decodes the JSON payload of a CallToolResult, or turns an exception
+    raised by call_tool into an error dict. Text that isn't JSON is
+    returned as {"data": text}.
+    """
+    if isinstance(result, Exception):
+        return {"error": str(result)}
+    # A dict returned by a tool arrives as JSON text in result.content[0]
+    content = result.content[0].text if result.content else "{}"
+    try:
+        return loads_json(content)
+    except ValueError:
+        return {"data": content}
+
+
+class _PooledSession:
+    """
+    A single SSE connection and its initialized ClientSession.
+
+    The connection is owned by a dedicated task so the sse_client and
+    ClientSession contexts are entered and exited in the same task, as
+    anyio requires, while callers on other tasks share the session.
+    """
+
+    def __init__(self, url: str, max_in_flight: int):
+        self.url = url
+        self.session = None
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self._ready = None
+        self._closing = None
+        self._task = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.session is not None and not self._task.done()
+
+    async def open(self):
+        self._ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        await self._ready
+
+    async def _run(self):
+        try:
+            async with sse_client(self.url) as (read_stream, write_stream):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set_result(None)
+                    await self._closing.wait()
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+        finally:
+            self.session = None
+
+    async def close(self):
+        if self._closing is not None:
+            self._closing.set()
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception:
+                pass
+
+
+class SessionPool:
+    """
+    Keeps one health-checked session per MCP server URL and reconnects
+    automatically when a session drops.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        self.max_in_flight = max_in_flight
+        self.health_check_interval = health_check_interval
+        self._sessions = {}
+        self._locks = {}
+        self._health_task = None
+
+    async def _get(self, url: str) -> _PooledSession:
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            pooled = self._sessions.get(url)
+            if pooled is None or not pooled.healthy:
+                if pooled is not None:
+                    await pooled.close()
+                pooled = _PooledSession(url, self.max_in_flight)
+                async with span("session.connect", kind="connect", url=url):
+                    await pooled.open()
+                self._sessions[url] = pooled
+
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_check())
+        return pooled
+
+    async def _discard(self, url: str, pooled: _PooledSession):
+        if self._sessions.get(url) is pooled:
+            del self._sessions[url]
+        await pooled.close()
+
+    async def call_tool(self, url: str, name: str, arguments: dict = None, retries: int = 1,
+                        progress_callback=None, deadline: float = None):
+        """
+        Calls a tool on the MCP server at url using the pooled session.
+        Connection failures drop the session and retry on a fresh one;
+        errors reported by the tool itself are raised as-is.
+        progress_callback(progress, total, message) receives the tool's
+        progress notifications, e.g. streamed article text.
+        With a deadline (wall-clock time) the call times out when it passes,
+        and no retry is made once it has.
+        """
+        for attempt in range(retries + 1):
+            read_timeout = None
+            if deadline:
+                if remaining(deadline) <= 0:
+                    raise TimeoutError(f"Deadline passed before calling {name}")
+                read_timeout = timedelta(seconds=remaining(deadline))
+            pooled = await self._get(url)
+            async with pooled.semaphore:
+                try:
+                    async with span(name, kind="client", attempt=attempt):
+                        return await pooled.session.call_tool(
+                            name, arguments=arguments or {}, read_timeout_seconds=read_timeout,
+                            progress_callback=progress_callback
+                        )
+                except McpError:
+                    raise
+                except Exception:
+                    await self._discard(url, pooled)
+                    if attempt == retries or (deadline and remaining(deadline) <= 0):
+                        raise
+
+    async def _health_check(self):
+        while self._sessions:
+            await asyncio.sleep(self.health_check_interval)
+            for url, pooled in list(self._sessions.items()):
+                if not pooled.healthy:
+                    await self._discard(url, pooled)
+                    continue
+                try:
+                    await asyncio.wait_for(pooled.session.send_ping(), self.health_check_interval)
+                except Exception:
+                    await self._discard(url, pooled)
+
+    async def close(self):
+        """
+        Closes every pooled session.
+        """
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for url, pooled in list(self._sessions.items()):
+            await self._discard(url, pooled)
+
+
+# One pool per event loop; sessions cannot be shared across loops
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_session_pool() -> SessionPool:
+    """
+    Returns the shared session pool for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = SessionPool()
+        _pools[loop] = pool
+    return pool
@@ -0,0 +1,309 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from synapse.protocol import post_office
+from synapse.protocol.delivery import wait_for
+from synapse.protocol.payload_store import resolve, share
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Work queue on top of the post office.
+#
+# A job is a post office message with status "queued" addressed to a
+# consumer group, which is the recipient (e.g. "Contextualist"). Any number
+# of workers in the group, in any process or on any host sharing the
+# mailbox, claim jobs by writing a lease to "<group>.leases". A leased job
+# is hidden from other workers until it is acked, released, or its
+# visibility timeout runs out without being extended. In that last case
+# (the worker crashed or hung) it is redelivered, up to MAX_DELIVERIES times.
+#
+# When a job finishes, the worker sends its result back to the job's sender
+# as a "<kind>.done" message, which dispatch() waits for.
+
+# Default seconds a claimed job stays invisible to other workers; running
+# jobs extend their lease well before it runs out
+VISIBILITY_TIMEOUT = float(os.getenv("WORK_QUEUE_VISIBILITY_TIMEOUT", "60"))
+
+# Deliveries of one job before it is given up on
+MAX_DELIVERIES = int(os.getenv("WORK_QUEUE_MAX_DELIVERIES", "3"))
+
+# How agents hand work to each other: "mcp" calls the agent's tool directly,
+# "queue" enqueues a job for that agent's workers
+AGENT_DISPATCH = os.getenv("AGENT_DISPATCH", "mcp")
+
+# Idle workers check for new jobs at this interval, backing off to the maximum
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+QUEUED = "queued"
+_LEASES = ".leases"
+
+_thread_lock = threading.Lock()
+
+# Per-group state folded from the log as it grows (see _sync): jobs that
+# are not yet acked or dead, in the order they were queued, and their leases
+_groups = {}
+
+
+class Job:
+    """
+    A claimed job. args are the keyword arguments for the handler.
+    """
+
+    def __init__(self, group: str, message: dict, attempt: int, lease_until: float, worker_id: str):
+        payload = message.get("payload", {})
+        self.group = group
+        self.id = payload["job_id"]
+        self.kind = payload["kind"]
+        self.args = payload.get("args", {})
+        self.task_id = message.get("task_id")
+        self.reply_to = message.get("sender")
+        self.attempt = attempt
+        self.lease_until = lease_until
+        self.worker_id = worker_id
+
+
+@contextmanager
+def _group_locked(group: str):
+    """
+    Serializes claims for one group across threads and processes.
+    """
+    os.makedirs(post_office.POST_OFFICE_DIR, exist_ok=True)
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(post_office.POST_OFFICE_DIR, f".queue-{group}.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _send_event(job_id: str, group: str, task_id: str, status: str, worker_id: str, **fields):
+    post_office.send_message({
+        "sender": worker_id,
+        "recipient": group + _LEASES,
+        "task_id": task_id,
+        "status": status,
+        "payload": {"job_id": job_id, **fields},
+    })
+
+
+def _apply_event(state: dict, event: dict):
+    payload = event.get("payload", {})
+    job_id = payload.get("job_id")
+    if job_id not in state["pending"]:
+        # Finished, or cleared from the mailbox
+        return
+    lease = state["leases"].setdefault(job_id, {"status": None, "until": 0.0, "attempt": 0})
+    status = event.get("status")
+    if status == "leased":
+        lease.update(status="leased", until=payload["until"], attempt=payload["attempt"])
+    elif status == "extended":
+        # Extensions from a worker whose lease was already taken over are ignored
+        if lease["status"] == "leased" and payload.get("attempt") == lease["attempt"]:
+            lease["until"] = payload["until"]
+    elif status == "released":
+        if payload.get("attempt") == lease["attempt"]:
+            lease["status"] = "released"
+    elif status in ("acked", "dead"):
+        del state["pending"][job_id]
+        del state["leases"][job_id]
+
+
+def _sync(group: str) -> dict:
+    """
+    Brings the group's state up to date with the log, reading only what was
+    appended since the last call. Lease events are read before jobs (which
+    are enqueued without the group lock), so every event read refers to a
+    job that is read too. Must hold _group_locked.
+    """
+    state = _groups.get(group)
+    if state is None:
+        state = _groups[group] = {"jobs": None, "events": None, "pending": {}, "leases": {}}
+
+    events, events_cursor, events_reset = post_office.read_new(group + _LEASES, state["events"])
+    jobs, jobs_cursor, jobs_reset = post_office.read_new(group, state["jobs"])
+    if jobs_reset or events_reset:
+        # The mailbox was compacted (or this is the first call): rebuild from scratch
+        state["pending"].clear()
+        state["leases"].clear()
+        if not events_reset:
+            events, events_cursor, _ = post_office.read_new(group + _LEASES)
+        jobs, jobs_cursor, _ = post_office.read_new(group)
+    state["jobs"], state["events"] = jobs_cursor, events_cursor
+
+    for message in jobs:
+        payload = message.get("payload", {})
+        if message.get("status") == QUEUED and "job_id" in payload:
+            state["pending"][payload["job_id"]] = message
+    for event in events:
+        _apply_event(state, event)
+    return state
+
+
+def enqueue(group: str, kind: str, args: dict = None, task_id: str = None, sender: str = "dispatcher") -> str:
+    """
+    Adds a job for the workers of group and returns its job_id.
+    kind selects the handler; args are passed to it as keyword arguments.
+    """
+    job_id = uuid.uuid4().hex
+    post_office.send_message({
+        "sender": sender,
+        "recipient": group,
+        "task_id": task_id or job_id,
+        "status": QUEUED,
+        "payload": {"job_id": job_id, "kind": kind, "args": args or {}},
+    })
+    return job_id
+
+
+def claim(group: str, worker_id: str, visibility_timeout: float = VISIBILITY_TIMEOUT) -> Job:
+    """
+    Leases the oldest available job in group, or returns None.
+    Jobs whose lease expired are redelivered; jobs that already used up
+    MAX_DELIVERIES are dead-lettered instead, and their sender is told.
+    Only jobs that are still open are looked at, so the cost doesn't grow
+    with the number of jobs completed.
+    """
+    with _group_locked(group):
+        state = _sync(group)
+        now = time.time()
+        for job_id, message in list(state["pending"].items()):
+            lease = state["leases"].get(job_id)
+            if lease is not None:
+                if lease["status"] == "leased" and lease["until"] > now:
+                    continue
+                if lease["attempt"] >= MAX_DELIVERIES:
+                    _dead_letter(group, message, worker_id, f"gave up after {lease['attempt']} deliveries")
+                    del state["pending"][job_id]
+                    del state["leases"][job_id]
+                    continue
+
+            attempt = (lease["attempt"] if lease else 0) + 1
+            until = now + visibility_timeout
+            _send_event(job_id, group, message.get("task_id"), "leased", worker_id, until=until, attempt=attempt)
+            return Job(group, message, attempt, until, worker_id)
+    return None
+
+
+def extend(job: Job, visibility_timeout: float = VISIBILITY_TIMEOUT):
+    """
+    Pushes a running job's lease out by another visibility_timeout.
+    """
+    job.lease_until = time.time() + visibility_timeout
+    _send_event(job.id, job.group, job.task_id, "extended", job.worker_id,
+                until=job.lease_until, attempt=job.attempt)
+
+
+def ack(job: Job):
+    """
+    Marks a job as done so it is never delivered again.
+    """
+    _send_event(job.id, job.group, job.task_id, "acked", job.worker_id, attempt=job.attempt)
+
+
+def release(job: Job, error: str = None):
+    """
+    Gives a job back for immediate redelivery, e.g. after a handler error.
+    """
+    _send_event(job.id, job.group, job.task_id, "released", job.worker_id, attempt=job.attempt, error=error)
+
+
+def _reply(group: str, reply_to: str, task_id: str, kind: str, result):
+    post_office.send_message({
+        "sender": group,
+        "recipient": reply_to,
+        "task_id": task_id,
+        "status": f"{kind}.done",
+        "payload": share(result),
+    })
+
+
+def _dead_letter(group: str, message: dict, worker_id: str, reason: str):
+    payload = message["payload"]
+    _send_event(payload["job_id"], group, message.get("task_id"), "dead", worker_id, reason=reason)
+    _reply(group, message.get("sender"), message.get("task_id"), payload["kind"],
+           {"error": f"{payload['kind']} job failed: {reason}"})
+
+
+async def dispatch(group: str, kind: str, args: dict = None, task_id: str = None, timeout: float = 60) -> dict:
+    """
+    Enqueues a job and waits up to timeout seconds for its result.
+    """
+    sender = f"dispatcher-{uuid.uuid4().hex}"
+    task_id = task_id or uuid.uuid4().hex
+    enqueue(group, kind, args, task_id=task_id, sender=sender)
+    message = await wait_for(task_id, status=f"{kind}.done", timeout=timeout, recipient=sender)
+    return resolve(message.get("payload", {}))
+
+
+async def _process(job: Job, handler, visibility_timeout: float):
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(visibility_timeout / 3)
+            extend(job, visibility_timeout)
+
+    keep_alive = asyncio.ensure_future(heartbeat())
+    try:
+        result = await handler(**job.args)
+    except Exception as e:
+        print(f"[{job.worker_id}] {job.kind} {job.id} failed (attempt {job.attempt}): {e}")
+        if job.attempt >= MAX_DELIVERIES:
+            _dead_letter(job.group, {"payload": {"job_id": job.id, "kind": job.kind},
+                                     "sender": job.reply_to, "task_id": job.task_id},
+                         job.worker_id, str(e))
+        else:
+            release(job, error=str(e))
+        return
+    finally:
+        keep_alive.cancel()
+
+    ack(job)
+    _reply(job.group, job.reply_to, job.task_id, job.kind, result)
+
+
+async def run_worker(group: str, handlers: dict, concurrency: int = 4,
+                     visibility_timeout: float = VISIBILITY_TIMEOUT, worker_id: str = None):
+    """
+    Consumes jobs for group forever, running up to concurrency at once.
+    handlers maps a job kind to an async function called with the job's args.
+    """
+    worker_id = worker_id or f"{group}-{socket.gethostname()}-{os.getpid()}"
+    slots = asyncio.Semaphore(max(1, concurrency))
+    running = set()
+    idle = POLL_INTERVAL
+    print(f"[{worker_id}] consuming {group} jobs ({', '.join(handlers)})")
+
+    while True:
+        await slots.acquire()
+        # Claiming waits on a lock shared with other workers, so keep it off the loop
+        job = await asyncio.to_thread(claim, group, worker_id, visibility_timeout)
+        if job is None:
+            slots.release()
+            await asyncio.sleep(idle)
+            idle = min(idle * 2, MAX_POLL_INTERVAL)
+            continue
+        idle = POLL_INTERVAL
+
+        handler = handlers.get(job.kind)
+        if handler is None:
+            slots.release()
+            _dead_letter(group, {"payload": {"job_id": job.id, "kind": job.kind},
+                                 "sender": job.reply_to, "task_id": job.task_id},
+                         worker_id, f"no handler for '{job.kind}'")
+            continue
+
+        task = asyncio.ensure_future(_process(job, handler, visibility_timeout))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
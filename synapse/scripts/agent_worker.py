@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+from synapse.protocol.work_queue import VISIBILITY_TIMEOUT, run_worker
+
+# Queue workers for the agents.
+#
+# Each worker process consumes its agent's jobs from the post office and
+# runs them with the same code as the agent's MCP tools, so capacity grows
+# by starting more processes (on this host or any other sharing the mailbox
+# and payload store). Enable queue dispatch with AGENT_DISPATCH=queue.
+#
+#   python -m synapse.scripts.agent_worker contextualist --processes 4
+#   python -m synapse.scripts.agent_worker scout publisher --processes 2 --concurrency 16
+
+# agent name -> (module with JOB_HANDLERS, consumer group)
+AGENTS = {
+    "contextualist": ("synapse.agents.contextualist_agent.main", "Contextualist"),
+    "scout": ("synapse.agents.scout_agent.main", "Scout"),
+    "publisher": ("synapse.agents.publisher_agent.main", "Publisher"),
+}
+
+
+def _run(agent: str, concurrency: int, visibility_timeout: float):
+    module_name, group = AGENTS[agent]
+    handlers = importlib.import_module(module_name).JOB_HANDLERS
+    try:
+        asyncio.run(run_worker(group, handlers, concurrency, visibility_timeout))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run agent workers that consume jobs from the post office.")
+    parser.add_argument("agents", nargs="+", choices=sorted(AGENTS))
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes per agent")
+    parser.add_argument("--concurrency", type=int, default=8, help="Jobs each process runs at once")
+    parser.add_argument("--visibility-timeout", type=float, default=VISIBILITY_TIMEOUT,
+                        help="Seconds before a job held by an unresponsive worker is redelivered")
+    args = parser.parse_args(argv)
+
+    workers = [
+        multiprocessing.Process(target=_run, args=(agent, args.concurrency, args.visibility_timeout))
+        for agent in args.agents
+        for _ in range(max(1, args.processes))
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == "__main__":
+    main()
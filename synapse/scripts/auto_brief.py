@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from dotenv import load_dotenv
+from synapse.common.gazetteer import resolve_location
+from synapse.common.rate_limit import TokenBucket
+from synapse.common.stats import summarize
+from synapse.pipeline import run_publisher, run_scout
+from synapse.protocol.session_pool import get_session_pool
+
+# Headless batch brief runner.
+#
+# Reads topics from a file or stdin (one per line, optionally "topic<TAB>city",
+# or JSON lines with "topic"/"city"), drives Scout -> Publisher for each with
+# a pool of workers sharing pooled MCP sessions, and appends one JSON line
+# per finished brief to the output file. Prints throughput and tail latency
+# at the end of every run.
+#
+#   python -m synapse.scripts.auto_brief topics.txt --workers 8 --output briefs.jsonl
+#   cat topics.txt | python -m synapse.scripts.auto_brief - --interval 86400
+
+load_dotenv()
+
+DEFAULT_CITY = "Washington D.C."
+
+
+def parse_topics(lines) -> list:
+    """
+    Parses input lines into {"topic", "city"} items, resolving missing
+    cities through the offline gazetteer.
+    """
+    items = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            record = json.loads(line)
+            topic, city = record.get("topic", ""), record.get("city")
+        elif "\t" in line:
+            topic, city = line.split("\t", 1)
+        else:
+            topic, city = line, None
+        if not city:
+            location = resolve_location(topic)
+            city = location["city"] if location else DEFAULT_CITY
+        items.append({"topic": topic.strip(), "city": city.strip()})
+    return items
+
+
+def _read_input(path: str) -> list:
+    if path == "-":
+        return parse_topics(sys.stdin)
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_topics(f)
+
+
+async def _brief(item: dict, scout_limit: TokenBucket, publisher_limit: TokenBucket) -> dict:
+    """
+    Produces one brief and returns a result record with per-stage timings.
+    """
+    task_id = f"auto-{uuid.uuid4().hex}"
+    record = {"task_id": task_id, "topic": item["topic"], "city": item["city"]}
+    started = time.perf_counter()
+    try:
+        await scout_limit.acquire()
+        scout_started = time.perf_counter()
+        scout_data = await run_scout(item["topic"], item["city"], task_id)
+        record["scout_seconds"] = round(time.perf_counter() - scout_started, 3)
+        if "error" in scout_data:
+            record["error"] = scout_data["error"]
+            return record
+
+        await publisher_limit.acquire()
+        publish_started = time.perf_counter()
+        result = await run_publisher(scout_data)
+        record["publish_seconds"] = round(time.perf_counter() - publish_started, 3)
+        if "error" in result:
+            record["error"] = result["error"]
+        else:
+            record["article"] = result.get("article")
+            record["cached"] = result.get("cached", False)
+    except Exception as e:
+        record["error"] = str(e)
+    finally:
+        record["latency_seconds"] = round(time.perf_counter() - started, 3)
+        record["finished_at"] = datetime.utcnow().isoformat()
+    return record
+
+
+async def run_batch(items: list, output_path: str, workers: int = 4,
+                    scout_rps: float = 2.0, publisher_rps: float = 2.0) -> dict:
+    """
+    Runs every item through the pipeline with a pool of workers and writes
+    results to output_path (JSON Lines) as they finish. Returns a summary.
+    """
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    # Per-upstream request rate limits, with one second of burst
+    scout_limit = TokenBucket(rate=scout_rps, capacity=max(1, scout_rps))
+    publisher_limit = TokenBucket(rate=publisher_rps, capacity=max(1, publisher_rps))
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await _brief(item, scout_limit, publisher_limit)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                latencies.append(record["latency_seconds"])
+                if "error" in record:
+                    errors += 1
+                    print(f"[error] {record['topic']}: {record['error']}", file=sys.stderr)
+                else:
+                    print(f"[done] {record['topic']} ({record['latency_seconds']}s)", file=sys.stderr)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+        finally:
+            await get_session_pool().close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "items": len(items),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "items_per_second": round(len(items) / elapsed, 3) if elapsed else 0.0,
+        "latency": summarize(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate daily briefs for a list of topics.")
+    parser.add_argument("input", help="Topic file, or - to read from stdin")
+    parser.add_argument("--output", default="briefs.jsonl", help="JSON Lines file results are appended to")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("AUTO_BRIEF_WORKERS", "4")))
+    parser.add_argument("--scout-rps", type=float, default=2.0, help="Max Scout calls per second")
+    parser.add_argument("--publisher-rps", type=float, default=2.0, help="Max Publisher calls per second")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="Run again every INTERVAL seconds (daemon mode); 0 runs once")
+    args = parser.parse_args(argv)
+
+    items = _read_input(args.input)
+    while True:
+        summary = asyncio.run(run_batch(
+            items, args.output, workers=args.workers,
+            scout_rps=args.scout_rps, publisher_rps=args.publisher_rps
+        ))
+        print(json.dumps(summary, indent=4))
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+        # Re-read file input so the topic list can change between runs
+        if args.input != "-":
+            items = _read_input(args.input)
+
+
+if __name__ == "__main__":
+    main()
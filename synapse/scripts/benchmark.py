@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from synapse.common.gateway import DEFAULT_LIMITS
+from synapse.common.stats import summarize
+from synapse.pipeline import run_publisher, run_scout
+from synapse.protocol.session_pool import get_session_pool
+from synapse.scripts.stub_upstreams import stub_environment
+
+# Offline end-to-end benchmark.
+#
+# Starts the stub upstream APIs and every MCP server and agent (pointed at
+# the stubs through the *_BASE_URL variables, with a throwaway mailbox and
+# payload store), then drives Scout -> Publisher at increasing concurrency
+# and reports throughput and p50/p95/p99 per stage. Results can be saved and compared
+# against an earlier run to catch regressions.
+#
+#   python -m synapse.scripts.benchmark --levels 1,4,16 --save bench.json
+#   python -m synapse.scripts.benchmark --compare bench.json --threshold 0.15
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (name, script relative to ROOT_DIR, port) in start-up order
+SERVICES = (
+    ("world-data", "synapse/mcp-servers/world-data/server.py", 8001),
+    ("finance-monitor", "synapse/mcp-servers/finance-monitor/server.py", 8002),
+    ("media-engine", "synapse/mcp-servers/media-engine/server.py", 8003),
+    ("contextualist", "synapse/agents/contextualist_agent/main.py", 8000),
+    ("scout", "synapse/agents/scout_agent/main.py", 8004),
+    ("publisher", "synapse/agents/publisher_agent/main.py", 8005),
+)
+
+CITIES = ("London", "Paris", "Tokyo", "New York", "Berlin", "Mumbai", "Sydney", "Toronto")
+
+TOPICS = ("Inflation", "Elections", "Climate policy", "Tech earnings", "Trade talks", "Housing market")
+
+# Stages reported for every level; context and media come from Scout's own timings
+STAGES = ("total", "scout", "context", "media", "publish")
+
+# Latency percentiles compared between runs
+COMPARED_PERCENTILES = ("p50", "p95", "p99")
+
+
+async def _wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+            await asyncio.sleep(0.2)
+
+
+def _start(args: list, env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(args, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def start_stack(work_dir: str, stub_port: int, stub_args: list) -> list:
+    """
+    Starts the stub upstreams and every service. Returns the processes;
+    logs are written to work_dir.
+    """
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    env = dict(os.environ)
+    env.update(stub_environment(stub_url))
+    env["PYTHONPATH"] = ROOT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env["POST_OFFICE_DIR"] = os.path.join(work_dir, "mailbox")
+    env["PAYLOAD_STORE_DIR"] = os.path.join(work_dir, "payloads")
+    env["DEMAND_LOG"] = os.path.join(work_dir, "demand.jsonl")
+    env["HISTORY_DIR"] = os.path.join(work_dir, "history")
+    # Fresh in-memory caches only, and no token budget or upstream quota
+    # throttling: the stubs have no quotas, and the benchmark measures the pipeline
+    env.pop("CACHE_DIR", None)
+    env.setdefault("LLM_TOKENS_PER_MINUTE", str(10**9))
+    for provider in DEFAULT_LIMITS:
+        env.setdefault(f"GATEWAY_RATE_{provider.upper()}", str(10**9))
+        env.setdefault(f"GATEWAY_BURST_{provider.upper()}", str(10**9))
+
+    processes = [_start(
+        [sys.executable, "-m", "synapse.scripts.stub_upstreams", "--port", str(stub_port)] + stub_args,
+        env, os.path.join(work_dir, "stub_upstreams.log")
+    )]
+    await _wait_for_port(stub_port)
+
+    for name, script, port in SERVICES:
+        processes.append(_start(
+            [sys.executable, os.path.join(ROOT_DIR, script)], env, os.path.join(work_dir, f"{name}.log")
+        ))
+        await _wait_for_port(port)
+    return processes
+
+
+def stop_stack(processes: list):
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _items(count: int, warm: bool) -> list:
+    """
+    Builds benchmark inputs. Cold runs give every brief its own topic so the
+    news, image and article caches miss; warm runs reuse a few topics.
+    """
+    items = []
+    for i in range(count):
+        topic = TOPICS[i % len(TOPICS)]
+        if not warm:
+            topic = f"{topic} {uuid.uuid4().hex[:8]}"
+        items.append({"topic": topic, "city": CITIES[i % len(CITIES)]})
+    return items
+
+
+async def _measure(item: dict) -> dict:
+    """
+    Runs one brief and returns its per-stage timings in seconds.
+    """
+    record = {}
+    started = time.perf_counter()
+    try:
+        scout_data = await run_scout(item["topic"], item["city"], f"bench-{uuid.uuid4().hex}")
+        record["scout"] = time.perf_counter() - started
+        if "error" in scout_data:
+            record["error"] = scout_data["error"]
+            return record
+        for stage in ("context", "media"):
+            if stage in scout_data.get("timings", {}):
+                record[stage] = scout_data["timings"][stage]
+
+        publish_started = time.perf_counter()
+        result = await run_publisher(scout_data)
+        record["publish"] = time.perf_counter() - publish_started
+        if "error" in result:
+            record["error"] = result["error"]
+    except Exception as e:
+        record["error"] = str(e)
+    finally:
+        record["total"] = time.perf_counter() - started
+    return record
+
+
+async def run_level(concurrency: int, requests: int, warm: bool) -> dict:
+    """
+    Runs requests briefs with at most concurrency in flight and summarizes them.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(item):
+        async with semaphore:
+            return await _measure(item)
+
+    started = time.perf_counter()
+    records = await asyncio.gather(*(bounded(item) for item in _items(requests, warm)))
+    elapsed = time.perf_counter() - started
+
+    errors = [r["error"] for r in records if "error" in r]
+    ok = [r for r in records if "error" not in r]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "sample_errors": errors[:3],
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "stages": {stage: summarize([r[stage] for r in ok if stage in r]) for stage in STAGES},
+    }
+
+
+async def run_benchmark(levels: list, requests: int, warm: bool) -> list:
+    """
+    Runs every concurrency level against already running services.
+    """
+    results = []
+    try:
+        # One untimed brief opens the pooled sessions before measuring
+        await _measure(_items(1, warm)[0])
+        for level in levels:
+            result = await run_level(level, max(requests, level * 2), warm)
+            print_level(result)
+            results.append(result)
+    finally:
+        await get_session_pool().close()
+    return results
+
+
+def print_level(result: dict):
+    print(f"\nconcurrency={result['concurrency']}  requests={result['requests']}  "
+          f"errors={result['errors']}  throughput={result['throughput']}/s", file=sys.stderr)
+    for stage, summary in result["stages"].items():
+        if summary.get("count"):
+            print(f"  {stage:<8} p50={summary['p50']:.3f}s  p95={summary['p95']:.3f}s  "
+                  f"p99={summary['p99']:.3f}s", file=sys.stderr)
+    for error in result["sample_errors"]:
+        print(f"  error: {error}", file=sys.stderr)
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Compares two benchmark reports level by level. Returns a list of
+    regressions: latency percentiles that grew, or throughput that fell,
+    by more than threshold (a fraction, e.g. 0.1 for 10%).
+    """
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in current.get("levels", []):
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        concurrency = level["concurrency"]
+
+        if before["throughput"] and level["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append({
+                "concurrency": concurrency, "metric": "throughput",
+                "before": before["throughput"], "after": level["throughput"],
+                "change": round(level["throughput"] / before["throughput"] - 1, 3),
+            })
+
+        for stage, summary in level["stages"].items():
+            old = before["stages"].get(stage, {})
+            for q in COMPARED_PERCENTILES:
+                if not old.get(q) or q not in summary:
+                    continue
+                if summary[q] > old[q] * (1 + threshold):
+                    regressions.append({
+                        "concurrency": concurrency, "metric": f"{stage}.{q}",
+                        "before": old[q], "after": summary[q],
+                        "change": round(summary[q] / old[q] - 1, 3),
+                    })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Scout -> Publisher against stub upstream APIs.")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="Briefs per level (at least 2x the level)")
+    parser.add_argument("--warm", action="store_true", help="Reuse a few topics so caches are hit")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--stub-arg", action="append", default=[],
+                        help="Extra argument for stub_upstreams, e.g. --stub-arg=--set=openai.latency=1.0")
+    parser.add_argument("--external", action="store_true",
+                        help="Use services that are already running instead of starting them")
+    parser.add_argument("--save", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Earlier report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+
+    async def run():
+        if args.external:
+            return await run_benchmark(levels, args.requests, args.warm)
+        with tempfile.TemporaryDirectory(prefix="synapse-bench-") as work_dir:
+            processes = await start_stack(work_dir, args.stub_port, args.stub_arg)
+            try:
+                return await run_benchmark(levels, args.requests, args.warm)
+            finally:
+                stop_stack(processes)
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "warm": args.warm,
+        "stub_args": args.stub_arg,
+        "levels": asyncio.run(run()),
+    }
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        print(json.dumps({"regressions": regressions}, indent=4))
+        if regressions:
+            sys.exit(1)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
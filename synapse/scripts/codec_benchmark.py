@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from synapse.common.codec import available_codecs, get_codec
+from synapse.protocol import post_office
+
+# Microbenchmark for the serialization codecs.
+# Measures encode/decode throughput for a representative post office
+# envelope with every available codec (plus the old pretty-printed JSON for
+# reference), then writes and reads back a mailbox with each codec to
+# compare on-disk size and read speed.
+#
+#   python -m synapse.scripts.codec_benchmark --iterations 20000 --messages 5000
+
+
+def sample_envelope(i: int = 0) -> dict:
+    """
+    A message shaped like a Contextualist signal sent to Scout.
+    """
+    return {
+        "sender": "Contextualist",
+        "recipient": "Scout",
+        "task_id": f"bench-{i:08d}",
+        "status": "data_gathered",
+        "timestamp": "2026-01-01T08:00:00.000000",
+        "payload": {
+            "topic": "Central bank policy",
+            "city": "London",
+            "news_context": {
+                "headline": "Central bank holds rates as inflation cools",
+                "description": "Policymakers voted to keep the benchmark rate unchanged, citing "
+                               "easing price pressures and a softer labour market. " * 4,
+                "source": "Example Wire",
+                "url": "https://news.example/articles/central-bank-holds-rates",
+                "published_date": "2026-01-01T07:30:00Z",
+            },
+            "weather_context": {"temperature": 7.4, "humidity": 81, "description": "light rain",
+                                "city": "London", "country": "GB"},
+            "financial_context": {"base_code": "USD", "target_code": "GBP", "conversion_rate": 0.7891,
+                                  "last_update": "Thu, 01 Jan 2026 00:00:01 +0000",
+                                  "location_queried": "London"},
+        },
+    }
+
+
+class _PrettyJson:
+    """
+    The original post office format, for reference.
+    """
+    name = "json-indent (old)"
+
+    def encode(self, value) -> bytes:
+        return json.dumps(value, indent=4).encode("utf-8")
+
+    def decode(self, data: bytes):
+        return json.loads(data)
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds) if seconds else 0.0
+
+
+def bench_codec(codec, message: dict, iterations: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        data = codec.encode(message)
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(data)
+    decode_seconds = time.perf_counter() - start
+
+    return {
+        "codec": codec.name,
+        "bytes": len(data),
+        "encode_per_second": _rate(iterations, encode_seconds),
+        "decode_per_second": _rate(iterations, decode_seconds),
+    }
+
+
+def bench_mailbox(codec_name: str, messages: int) -> dict:
+    """
+    Sends messages through a throwaway post office written with codec_name
+    and reads them back, reporting segment size and throughput.
+    """
+    work_dir = tempfile.mkdtemp(prefix="synapse-codec-")
+    saved = (post_office.POST_OFFICE_DIR, post_office.POST_OFFICE_CODEC)
+    post_office.POST_OFFICE_DIR = work_dir
+    post_office.POST_OFFICE_CODEC = codec_name
+    post_office._index_cache.clear()
+    try:
+        start = time.perf_counter()
+        for i in range(messages):
+            post_office.send_message(sample_envelope(i))
+        write_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read = post_office.read_messages()
+        read_seconds = time.perf_counter() - start
+
+        size = sum(
+            os.path.getsize(os.path.join(work_dir, name))
+            for name in os.listdir(work_dir) if name.endswith(".log") and name.startswith("segment-")
+        )
+        return {
+            "codec": codec_name,
+            "messages": len(read),
+            "segment_bytes": size,
+            "bytes_per_message": round(size / messages, 1) if messages else 0,
+            "write_per_second": _rate(messages, write_seconds),
+            "read_per_second": _rate(len(read), read_seconds),
+        }
+    finally:
+        post_office.POST_OFFICE_DIR, post_office.POST_OFFICE_CODEC = saved
+        post_office._index_cache.clear()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare serialization codecs for post office envelopes.")
+    parser.add_argument("--iterations", type=int, default=20000, help="Encode/decode rounds per codec")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages written per mailbox run")
+    args = parser.parse_args(argv)
+
+    message = sample_envelope()
+    codecs = [_PrettyJson()] + [get_codec(name) for name in available_codecs()]
+    report = {
+        "codecs": [bench_codec(codec, message, args.iterations) for codec in codecs],
+        "mailbox": [bench_mailbox(name, args.messages) for name in available_codecs()],
+    }
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
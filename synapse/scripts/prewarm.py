@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from dotenv import load_dotenv
+from synapse.common.rate_limit import TokenBucket
+from synapse.pipeline import run_publisher, run_scout
+from synapse.protocol import demand
+from synapse.protocol.session_pool import extract_data, get_session_pool
+
+# Cache pre-warm scheduler.
+#
+# Ranks topic/city pairs by expected demand (recorded from Scout traffic,
+# see synapse.protocol.demand) and keeps the hottest ones warm: each
+# provider's cached data is refreshed shortly before it would expire, and
+# the Publisher's article is regenerated when that data changed, so the
+# next interactive brief for a popular pair finds everything cached.
+# Refreshes are capped by a per-provider daily budget, spent hottest first.
+#
+#   python -m synapse.scripts.prewarm --top 20 --lead 3600
+#   python -m synapse.scripts.prewarm --once --budget news=40 --budget articles=20
+
+load_dotenv()
+
+WORLD_DATA_URL = "http://127.0.0.1:8001/sse"
+FINANCE_URL = "http://127.0.0.1:8002/sse"
+MEDIA_ENGINE_URL = "http://127.0.0.1:8003/sse"
+
+# Images per topic, matching what Scout asks for so the same cache entry is warmed
+SCOUT_IMAGE_COUNT = 2
+
+# provider -> (refresh cadence in seconds, what one refresh covers). The
+# cadences follow the servers' cache TTLs, which are read from the same variables.
+PROVIDERS = {
+    "news": (float(os.getenv("CACHE_TTL_NEWS", "300")), "topic"),
+    "weather": (float(os.getenv("CACHE_TTL_WEATHER", "600")), "city"),
+    "fx": (float(os.getenv("CACHE_TTL_FX", "3600")), None),
+    "images": (float(os.getenv("CACHE_TTL_IMAGES", "86400")), "topic"),
+    # Articles are keyed by their inputs, so they go stale when the news does
+    "articles": (float(os.getenv("CACHE_TTL_NEWS", "300")), "pair"),
+}
+
+# Refreshes per provider per day; articles count LLM generations.
+# Overridable with PREWARM_BUDGET_<PROVIDER> or --budget provider=N.
+DEFAULT_BUDGETS = {"news": 50, "weather": 500, "fx": 24, "images": 100, "articles": 100}
+
+# Refresh this long before an entry would expire
+REFRESH_MARGIN_SECONDS = 60
+
+# Briefs regenerated at once
+ARTICLE_CONCURRENCY = 2
+
+
+def _budgets(overrides: list) -> dict:
+    budgets = {p: float(os.getenv(f"PREWARM_BUDGET_{p.upper()}", n)) for p, n in DEFAULT_BUDGETS.items()}
+    for override in overrides:
+        provider, _, value = override.partition("=")
+        if provider not in budgets:
+            raise ValueError(f"Unknown provider '{provider}' (one of {', '.join(budgets)})")
+        budgets[provider] = float(value)
+    return budgets
+
+
+class Prewarmer:
+    """
+    Keeps the hottest topic/city pairs warm within a per-provider daily budget.
+    """
+
+    def __init__(self, budgets: dict, top: int = 20, lead: float = 3600, interval: float = 60):
+        self.top = top
+        self.lead = lead
+        self.interval = interval
+        # At most an hour's share of a day's budget can be spent at once
+        self.buckets = {p: TokenBucket(b / 86400, max(1.0, b / 24)) for p, b in budgets.items() if b > 0}
+        self.refreshed = {}  # (provider, key) -> time of our last refresh
+        self.stats = {p: {"refreshed": 0, "skipped_budget": 0, "errors": 0} for p in PROVIDERS}
+
+    def _due(self, provider: str, key: str, now: float) -> bool:
+        cadence = PROVIDERS[provider][0]
+        last = self.refreshed.get((provider, key))
+        # Refresh when the entry would expire before the tick after next
+        return last is None or now - last >= cadence - self.interval - REFRESH_MARGIN_SECONDS
+
+    def _plan(self, hot: list, now: float) -> list:
+        """
+        (provider, key, pair) refreshes that are due, hottest pairs first.
+        """
+        plan = []
+        seen = set()
+        for pair in hot:
+            keys = {"topic": pair["topic"].lower(), "city": pair["city"].lower(),
+                    "pair": f"{pair['topic'].lower()}|{pair['city'].lower()}", None: "table"}
+            for provider, (_, scope) in PROVIDERS.items():
+                key = keys[scope]
+                if (provider, key) in seen or not self._due(provider, key, now):
+                    continue
+                seen.add((provider, key))
+                plan.append((provider, key, pair))
+        return plan
+
+    async def _refresh_data(self, provider: str, pair: dict):
+        pool = get_session_pool()
+        # Renew anything that would expire before our next look at it
+        common = {"task_id": f"{demand.PREWARM_TASK_PREFIX}{uuid.uuid4().hex}",
+                  "refresh_within": self.interval + REFRESH_MARGIN_SECONDS}
+        if provider == "news":
+            result = await pool.call_tool(WORLD_DATA_URL, "search_news", {"query": pair["topic"], **common})
+        elif provider == "weather":
+            result = await pool.call_tool(WORLD_DATA_URL, "get_weather", {"city": pair["city"], **common})
+        elif provider == "fx":
+            result = await pool.call_tool(FINANCE_URL, "get_fx_rate", {"location": pair["city"], **common})
+        else:
+            result = await pool.call_tool(MEDIA_ENGINE_URL, "search_images",
+                                          {"query": pair["topic"], "count": SCOUT_IMAGE_COUNT, **common})
+        return extract_data(result)
+
+    async def _refresh_article(self, pair: dict) -> dict:
+        # The brief runs like an interactive one, so it reads the data just refreshed
+        task_id = f"{demand.PREWARM_TASK_PREFIX}{uuid.uuid4().hex}"
+        scout_data = await run_scout(pair["topic"], pair["city"], task_id)
+        if "error" in scout_data:
+            return scout_data
+        return await run_publisher(scout_data)
+
+    async def tick(self) -> dict:
+        """
+        Runs one round of refreshes and returns what was done.
+        """
+        now = time.time()
+        hot = demand.expected_demand(lead=self.lead, now=now)[:self.top]
+        plan = self._plan(hot, now)
+        done = []
+
+        async def run(provider, key, pair):
+            bucket = self.buckets.get(provider)
+            if provider == "articles":
+                # Only a regenerated article costs an LLM call, so it is charged afterwards
+                if bucket is None or bucket.available() < 1:
+                    self.stats[provider]["skipped_budget"] += 1
+                    return
+            elif bucket is None or not bucket.try_acquire():
+                self.stats[provider]["skipped_budget"] += 1
+                return
+
+            try:
+                if provider == "articles":
+                    result = await self._refresh_article(pair)
+                    if not result.get("cached"):
+                        bucket.try_acquire()
+                else:
+                    result = await self._refresh_data(provider, pair)
+            except Exception as e:
+                result = {"error": str(e)}
+
+            if isinstance(result, dict) and "error" in result:
+                self.stats[provider]["errors"] += 1
+                return
+            self.refreshed[(provider, key)] = time.time()
+            self.stats[provider]["refreshed"] += 1
+            done.append({"provider": provider, "key": key})
+
+        # Data first, so regenerated articles are built from it
+        data_plan = [step for step in plan if step[0] != "articles"]
+        await asyncio.gather(*(run(*step) for step in data_plan))
+
+        semaphore = asyncio.Semaphore(ARTICLE_CONCURRENCY)
+
+        async def run_article(step):
+            async with semaphore:
+                await run(*step)
+
+        await asyncio.gather(*(run_article(step) for step in plan if step[0] == "articles"))
+
+        return {"hot": len(hot), "due": len(plan), "refreshed": done}
+
+    async def run_forever(self):
+        last_trim = 0.0
+        while True:
+            started = time.time()
+            try:
+                summary = await self.tick()
+                if summary["refreshed"]:
+                    print(json.dumps({"at": round(started), **summary}), file=sys.stderr)
+            except Exception as e:
+                print(f"Pre-warm round failed: {e}", file=sys.stderr)
+            if started - last_trim > 24 * 60 * 60:
+                demand.trim()
+                last_trim = started
+            await asyncio.sleep(max(0.0, self.interval - (time.time() - started)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep caches warm for the most requested topics and cities.")
+    parser.add_argument("--top", type=int, default=20, help="Topic/city pairs to keep warm")
+    parser.add_argument("--lead", type=float, default=3600,
+                        help="Seconds ahead to forecast demand for (time-of-day weighting)")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between rounds")
+    parser.add_argument("--budget", action="append", default=[],
+                        help="Daily refresh budget for a provider, e.g. news=40 (repeatable)")
+    parser.add_argument("--once", action="store_true", help="Run one round and print what was refreshed")
+    args = parser.parse_args(argv)
+
+    prewarmer = Prewarmer(_budgets(args.budget), args.top, args.lead, args.interval)
+
+    async def run():
+        try:
+            if args.once:
+                summary = await prewarmer.tick()
+                print(json.dumps({**summary, "stats": prewarmer.stats}, indent=4))
+            else:
+                await prewarmer.run_forever()
+        finally:
+            await get_session_pool().close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Local stand-ins for the external APIs the pipeline calls (NewsAPI,
+# OpenWeather, Pexels, ExchangeRate API and OpenAI chat completions), all
+# served from one port. Every provider has its own latency, jitter and
+# error rate so load tests can run without spending real quota.
+#
+# Point the servers and agents at it with the *_BASE_URL variables:
+#
+#   python -m synapse.scripts.stub_upstreams --port 9100 --latency 0.05 --set openai.latency=0.8
+#   NEWSAPI_BASE_URL=http://127.0.0.1:9100 OPENAI_BASE_URL=http://127.0.0.1:9100/v1 ...
+
+PROVIDERS = ("newsapi", "openweather", "pexels", "exchangerate", "openai")
+
+# Environment that points every upstream client at a stub on base_url
+BASE_URL_VARS = {
+    "NEWSAPI_BASE_URL": "",
+    "OPENWEATHER_BASE_URL": "",
+    "PEXELS_BASE_URL": "",
+    "EXCHANGERATE_BASE_URL": "",
+    "OPENAI_BASE_URL": "/v1",
+}
+
+# Words the stub article is built from, so responses have a realistic size
+_ARTICLE_WORDS = (
+    "officials markets residents analysts growth policy weather local economy "
+    "report council regional investment community outlook currency forecast"
+).split()
+
+_RATES = {"USD": 1.0, "EUR": 0.92, "GBP": 0.79, "JPY": 149.5, "INR": 83.1, "CNY": 7.24,
+          "AUD": 1.52, "CAD": 1.36, "CHF": 0.88, "BRL": 4.97, "MXN": 17.1, "ZAR": 18.6}
+
+
+def stub_environment(base_url: str) -> dict:
+    """
+    Returns the environment variables that send every upstream call to a
+    stub server at base_url, with placeholder API keys.
+    """
+    env = {name: base_url + suffix for name, suffix in BASE_URL_VARS.items()}
+    env.update({
+        "NEWSAPI_KEY": "stub",
+        "OPENWEATHER_API_KEY": "stub",
+        "PEXELS_API_KEY": "stub",
+        "EXCHANGE_RATE_API_KEY": "stub",
+        "OPENAI_API_KEY": "stub",
+    })
+    return env
+
+
+def default_profiles(latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0) -> dict:
+    """
+    Returns one {"latency", "jitter", "error_rate", "error_status"} profile per provider.
+    OpenAI starts slower than the data APIs, as it is in practice.
+    """
+    profiles = {
+        name: {"latency": latency, "jitter": jitter, "error_rate": error_rate, "error_status": 503}
+        for name in PROVIDERS
+    }
+    profiles["openai"]["latency"] = latency * 10
+    return profiles
+
+
+def apply_overrides(profiles: dict, overrides: list) -> dict:
+    """
+    Applies "provider.field=value" overrides (e.g. "openai.latency=1.5").
+    """
+    for override in overrides or []:
+        target, _, value = override.partition("=")
+        provider, _, field = target.partition(".")
+        if provider not in profiles or field not in profiles[provider]:
+            raise ValueError(f"Unknown stub setting: {override}")
+        profiles[provider][field] = type(profiles[provider][field])(float(value))
+    return profiles
+
+
+def create_app(profiles: dict) -> Starlette:
+    """
+    Builds the stub ASGI app. Request counts per provider are served on /stats.
+    """
+    stats = {name: {"requests": 0, "errors": 0} for name in PROVIDERS}
+
+    async def delay(provider: str):
+        """
+        Sleeps for the provider's latency and returns an error response
+        instead of None when this request should fail.
+        """
+        profile = profiles[provider]
+        stats[provider]["requests"] += 1
+        await asyncio.sleep(max(0.0, profile["latency"] + random.uniform(-1, 1) * profile["jitter"]))
+        if random.random() < profile["error_rate"]:
+            stats[provider]["errors"] += 1
+            return JSONResponse({"error": f"stub {provider} failure"}, status_code=profile["error_status"])
+        return None
+
+    async def news(request):
+        error = await delay("newsapi")
+        if error:
+            return error
+        query = request.query_params.get("q", "")
+        page_size = int(request.query_params.get("pageSize", "1"))
+        # "(a) OR (b)" queries get articles for each term in turn
+        terms = [term.strip().strip("()") for term in query.split(" OR ")] or [query]
+        articles = []
+        for i in range(page_size):
+            term = terms[i % len(terms)]
+            if i and i % 5 == 4:
+                # Every fifth article is a syndicated copy of the one before it
+                copy = dict(articles[-1])
+                copy["title"] = copy["title"] + " - Stub Syndicate"
+                copy["url"] = copy["url"] + "?utm_source=syndicate"
+                articles.append(copy)
+                continue
+            articles.append({
+                "source": {"id": None, "name": "Stub Wire"},
+                "title": f"{term}: developments #{i + 1}",
+                "description": f"Latest coverage of {term}. " + " ".join(random.choices(_ARTICLE_WORDS, k=40)),
+                "url": f"https://news.example/{uuid.uuid4().hex}",
+                "publishedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            })
+        return JSONResponse({"status": "ok", "totalResults": len(articles), "articles": articles})
+
+    async def weather(request):
+        error = await delay("openweather")
+        if error:
+            return error
+        return JSONResponse({
+            "name": request.query_params.get("q", "Unknown"),
+            "main": {"temp": round(random.uniform(-5, 35), 1), "humidity": random.randint(20, 95)},
+            "weather": [{"description": random.choice(["clear sky", "light rain", "overcast clouds"])}],
+            "sys": {"country": "XX"},
+        })
+
+    async def images(request):
+        error = await delay("pexels")
+        if error:
+            return error
+        per_page = int(request.query_params.get("per_page", "1"))
+        photos = [{
+            "id": random.randint(1, 10**7),
+            "width": 4000,
+            "height": 3000,
+            "url": f"https://images.example/photo/{i}",
+            "photographer": "Stub Photographer",
+            "src": {"large": f"https://images.example/photo/{i}/large.jpg"},
+            "alt": f"{request.query_params.get('query', '')} photo {i + 1}",
+        } for i in range(per_page)]
+        return JSONResponse({"total_results": per_page, "photos": photos})
+
+    async def rates(request):
+        error = await delay("exchangerate")
+        if error:
+            return error
+        base = request.path_params["base"]
+        base_rate = _RATES.get(base, 1.0)
+        now = int(time.time())
+        return JSONResponse({
+            "result": "success",
+            "base_code": base,
+            "time_last_update_utc": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(now)),
+            "time_next_update_unix": now + 3600,
+            "conversion_rates": {code: round(rate / base_rate, 6) for code, rate in _RATES.items()},
+        })
+
+    async def chat_completions(request):
+        error = await delay("openai")
+        if error:
+            return error
+        body = await request.json()
+        model = body.get("model", "stub")
+        words = random.choices(_ARTICLE_WORDS, k=min(int(body.get("max_tokens") or 300), 300))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "# Stub Headline\n\n" + " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+            })
+
+        async def events():
+            pieces = ["# Stub Headline\n\n"] + [word + " " for word in words]
+            for piece in pieces:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def stats_route(request):
+        return JSONResponse({"profiles": profiles, "stats": stats})
+
+    return Starlette(routes=[
+        Route("/v2/everything", news),
+        Route("/data/2.5/weather", weather),
+        Route("/v1/search", images),
+        Route("/v6/{key}/latest/{base}", rates),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/stats", stats_route),
+    ])
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for the pipeline's external APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Base latency of the data APIs in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Uniform +/- jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--set", action="append", default=[], metavar="PROVIDER.FIELD=VALUE",
+                        help="Per-provider override, e.g. openai.latency=1.5 or pexels.error_rate=0.1")
+    args = parser.parse_args(argv)
+
+    profiles = apply_overrides(default_profiles(args.latency, args.jitter, args.error_rate), args.set)
+    uvicorn.run(create_app(profiles), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
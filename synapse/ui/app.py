@@ -1,25 +1,58 @@
 import streamlit as st
-import asyncio
 import json
 import os
 import re
 from openai import OpenAI
 from dotenv import load_dotenv
-from mcp.client.session import ClientSession
-from mcp.client.sse import sse_client
+from synapse.common.cache import TTLCache
+from synapse.common.gazetteer import resolve_location
+from synapse.protocol.payload_store import resolve
+from synapse.ui.worker import BriefWorker
 
 # Build Streamlit Interface to Trigger Agents
 
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
-# Upstream Agent URLs
-SCOUT_AGENT_URL = "http://127.0.0.1:8004/sse"
-PUBLISHER_AGENT_URL = "http://127.0.0.1:8005/sse"
-
 client = OpenAI(api_key=api_key)
 
+@st.cache_resource
+def get_worker() -> BriefWorker:
+    """
+    One background worker (and event loop) shared by every session and rerun.
+    """
+    return BriefWorker(max_concurrent=int(os.getenv("UI_MAX_CONCURRENT_BRIEFS", "4")))
+
+@st.cache_resource
+def get_location_cache() -> TTLCache:
+    """
+    LLM answers for topics the gazetteer couldn't place, kept across reruns
+    (and across restarts when CACHE_DIR is set).
+    """
+    return TTLCache("locations", ttl=float(os.getenv("CACHE_TTL_LOCATIONS", "604800")), max_entries=2048)
+
 def get_location_context(news_text: str) -> dict:
+    """
+    Extracts country and capital from a text string.
+    Uses the offline gazetteer first and only asks the LLM when it has no
+    confident match; those answers are cached per topic.
+    """
+    location = resolve_location(news_text)
+    if location:
+        # Prefer a city named in the topic over the capital
+        return {"country": location["country"], "capital": location["city"]}
+
+    location_cache = get_location_cache()
+    key = " ".join(news_text.lower().split())
+    cached = location_cache.lookup(key)
+    if cached is not None:
+        return cached
+
+    location = _ask_llm_for_location(news_text)
+    location_cache.set(key, location)
+    return location
+
+def _ask_llm_for_location(news_text: str) -> dict:
     """
     Extracts country and capital from a text string using an LLM.
     """
@@ -39,26 +72,6 @@ def get_location_context(news_text: str) -> dict:
 
     return json.loads(response.choices[0].message.content)
 
-async def run_scout(topic: str, city: str):
-    """
-    Call the Scout Agent to orchestrate data gathering and aggregation.
-    """
-    async with sse_client(SCOUT_AGENT_URL) as (read_stream, write_stream):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-            result = await session.call_tool("scout", arguments={"topic": topic, "city": city})
-            return json.loads(result.content[0].text)
-
-async def run_publisher(payload: dict):
-    """
-    Call the Publisher Agent to generate the final article.
-    """
-    async with sse_client(PUBLISHER_AGENT_URL) as (read_stream, write_stream):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-            result = await session.call_tool("publish_brief", arguments={"payload": payload})
-            return json.loads(result.content[0].text)
-
 # Streamlit UI Components
 st.set_page_config(page_title="Synapse Daily Brief", page_icon="📝", layout="wide")
 st.title("📝 Synapse: Multi-Agent Daily Brief")
@@ -66,70 +79,98 @@ st.write("Generate a professional journalistic report based on real-time news, w
 
 topic = st.text_input("Enter a topic (e.g., 'Tech stocks', 'Climate change', 'Oil prices')", placeholder="AI Innovation")
 
+def render_report(topic: str, city: str, final_results: dict):
+    """
+    Render a finished brief.
+    """
+    st.success("Report Generated!")
+    st.markdown("---")
+
+    # Layout: Two columns for Image and Header info
+    col1, col2 = st.columns([1, 2])
+    
+    # The Publisher returns its input signal by reference; older results echo it
+    signal = resolve(final_results.get("payload_ref") or final_results.get("original_payload") or {})
+    signal = {**signal, "context": resolve(signal.get("context", {})), "media": resolve(signal.get("media", {}))}
+    media_data = signal["media"] or {}
+    images = media_data.get("images", [])
+    
+    with col1:
+        if images:
+            st.image(images[0].get("src"), caption=images[0].get("alt", "Topic Image"))
+        else:
+            st.info("No images found for this topic.")
+    
+    with col2:
+        st.header(f"Topic: {topic}")
+        st.subheader(f"Location Context: {city}")
+        st.write(f"Generated at: {java_time := ''}") # Placeholder for time if needed
+    
+    st.markdown("---")
+    
+    # Main Article in an Expander
+    article_content = final_results.get("article", "No article content available.")
+    
+    with st.expander("📖 Read Full Daily Brief", expanded=True):
+        # Attempt to split by sections if headers exist (Common LLM pattern uses # or **Section**)
+        # For now, we'll use a split regex for common headers
+        sections = re.split(r'\n(?=#{1,3} |\*\*.*?\*\*)', article_content)
+        
+        if len(sections) > 1:
+            for section in sections:
+                st.markdown(section.strip())
+        else:
+            st.markdown(article_content)
+
+    # Secondary Sections for Technical Data
+    st.markdown("### 🛠 Agent Signals & Raw Data")
+    tab1, tab2 = st.tabs(["Signal Payload", "Raw Response"])
+    
+    with tab1:
+        st.json(signal)
+    
+    with tab2:
+        st.json(final_results)
+
 if st.button("Generate Report"):
     if not topic:
         st.warning("Please enter a topic.")
     else:
-        with st.spinner("Generating report... this involves multiple agents coordinating."):
-            try:
-                # 1. Get Location Context
-                location = get_location_context(topic)
-                city = location.get("capital", "Washington D.C.")
-                
-                # 2. Run Scout Agent (Orchestration)
-                scout_data = asyncio.run(run_scout(topic, city))
-                
-                # 3. Run Publisher Agent (Content Generation)
-                final_results = asyncio.run(run_publisher(scout_data))
-                
-                # 4. Success State
-                st.success("Report Generated!")
-                st.markdown("---")
-
-                # Layout: Two columns for Image and Header info
-                col1, col2 = st.columns([1, 2])
-                
-                original_payload = final_results.get("original_payload", {})
-                media_data = original_payload.get("media", {})
-                images = media_data.get("images", [])
-                
-                with col1:
-                    if images:
-                        st.image(images[0].get("src"), caption=images[0].get("alt", "Topic Image"))
-                    else:
-                        st.info("No images found for this topic.")
-                
-                with col2:
-                    st.header(f"Topic: {topic}")
-                    st.subheader(f"Location Context: {city}")
-                    st.write(f"Generated at: {java_time := ''}") # Placeholder for time if needed
-                
-                st.markdown("---")
-                
-                # Main Article in an Expander
-                article_content = final_results.get("article", "No article content available.")
-                
-                with st.expander("📖 Read Full Daily Brief", expanded=True):
-                    # Attempt to split by sections if headers exist (Common LLM pattern uses # or **Section**)
-                    # For now, we'll use a split regex for common headers
-                    sections = re.split(r'\n(?=#{1,3} |\*\*.*?\*\*)', article_content)
-                    
-                    if len(sections) > 1:
-                        for section in sections:
-                            st.markdown(section.strip())
-                    else:
-                        st.markdown(article_content)
-
-                # Secondary Sections for Technical Data
-                st.markdown("### 🛠 Agent Signals & Raw Data")
-                tab1, tab2 = st.tabs(["Signal Payload", "Raw Response"])
-                
-                with tab1:
-                    st.json(original_payload)
-                
-                with tab2:
-                    st.json(final_results)
-                    
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                st.exception(e)
+        try:
+            # 1. Get Location Context
+            location = get_location_context(topic)
+            city = location.get("capital", "Washington D.C.")
+
+            # 2-3. Hand Scout Agent (Orchestration) and Publisher Agent (Content Generation)
+            # to the background worker and keep the job handle for this session
+            job = get_worker().submit(topic, city)
+            st.session_state["job_id"] = job.id
+
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            st.exception(e)
+
+@st.fragment(run_every=0.25)
+def follow_job(job_id: str):
+    """
+    Shows a running job's article as it streams in. Only this fragment
+    reruns on the timer, so the script thread is free between polls and a
+    stopped or rerun session simply stops polling; once the job is done,
+    the whole app reruns to render the report.
+    """
+    job = get_worker().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    st.info("Generating report... this involves multiple agents coordinating.")
+    if job.chunks:
+        st.markdown(job.text + "▌")
+
+# Follow the session's current job, surviving reruns while it is in flight
+job = get_worker().get(st.session_state.get("job_id", ""))
+if job is not None:
+    if not job.done:
+        follow_job(job.id)
+    elif job.status == "error":
+        st.error(f"An error occurred: {job.error}")
+    else:
+        render_report(job.topic, job.city, job.result)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+import uuid
+from synapse.pipeline import run_pipeline
+
+# Background worker for the Streamlit app.
+# One long-lived event loop runs in a daemon thread, so session-pool
+# connections persist across button presses and script reruns, and the
+# Streamlit script thread only polls a job handle instead of blocking.
+
+# Finished jobs kept around for late polling before the oldest are dropped
+MAX_FINISHED_JOBS = 200
+
+
+class BriefJob:
+    """
+    Handle for one brief running on the worker.
+    status moves from queued to running to done or error; text holds the
+    article as it streams in and result the Publisher's final response.
+    """
+
+    def __init__(self, topic: str, city: str):
+        self.id = uuid.uuid4().hex
+        self.topic = topic
+        self.city = city
+        self.status = "queued"
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "error")
+
+
+class BriefWorker:
+    """
+    Runs briefs concurrently on a persistent background event loop.
+    """
+
+    def __init__(self, max_concurrent: int = 4):
+        self.loop = asyncio.new_event_loop()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._semaphore = None
+        self._max_concurrent = max_concurrent
+        self._thread = threading.Thread(target=self.loop.run_forever, name="brief-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, topic: str, city: str) -> BriefJob:
+        """
+        Queues a brief and returns its job handle immediately.
+        """
+        job = BriefJob(topic, city)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        asyncio.run_coroutine_threadsafe(self._run(job), self.loop)
+        return job
+
+    def get(self, job_id: str) -> BriefJob:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    async def _run(self, job: BriefJob):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        async with self._semaphore:
+            job.status = "running"
+            try:
+                job.result = await run_pipeline(job.topic, job.city, on_text=job.chunks.append)
+            except Exception as e:
+                self._finish(job, "error", str(e))
+                return
+            if "error" in job.result:
+                self._finish(job, "error", job.result["error"])
+            else:
+                self._finish(job, "done")
+
+    def _finish(self, job: BriefJob, status: str, error: str = None):
+        # finished_at is set before the job counts as done, so _prune can sort by it
+        with self._lock:
+            job.error = error
+            job.finished_at = time.time()
+            job.status = status
+
+    def _prune(self):
+        finished = sorted((j for j in self._jobs.values() if j.done), key=lambda j: j.finished_at)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]